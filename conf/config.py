@@ -1,3 +1,5 @@
+from typing import Dict, Literal
+
 from pydantic_settings import BaseSettings
 
 
@@ -6,5 +8,79 @@ class Settings(BaseSettings):
     SECRET_KEY: str
     JWT_SECRET_SALT: str
 
+    # per process; for the web workers DB_CONNECTION_BUDGET, if set, replaces both with a share of
+    # the budget: all workers together open at most that many connections, and the server refuses
+    # to start with fewer connections than workers
+    DB_POOL_SIZE: int = 5
+    DB_MAX_OVERFLOW: int = 10
+    DB_CONNECTION_BUDGET: int = 0
+    # open the pool connections before a worker takes traffic
+    DB_POOL_WARMUP: bool = True
+    DB_POOL_TIMEOUT: float = 30
+    DB_POOL_RECYCLE: int = 1800
+    DB_POOL_PRE_PING: bool = False
+    # prepared statements cached per connection; PgBouncer (transaction pooling) mode turns caching off
+    DB_STATEMENT_CACHE_SIZE: int = 100
+    DB_PGBOUNCER_MODE: bool = False
+
+    # Sanic worker processes, also read by scripts/web/startup.sh
+    WEB_WORKERS: int = 1
+
+    BCRYPT_ROUNDS: int = 12
+    PASSWORD_HASH_WORKERS: int = 4
+    JWT_CACHE_SIZE: int = 10000
+
+    USER_PAGE_SIZE: int = 50
+    USER_PAGE_SIZE_MAX: int = 500
+
+    TRANSACTION_PAGE_SIZE: int = 50
+    TRANSACTION_PAGE_SIZE_MAX: int = 500
+    TRANSACTION_EXPORT_FETCH_SIZE: int = 1000
+    WEBHOOK_BATCH_MAX_SIZE: int = 1000
+
+    # monthly range partitions of billing.transaction, see scripts/partition_transactions.py
+    TRANSACTION_PARTITIONING: bool = False
+    TRANSACTION_PARTITIONS_AHEAD: int = 3
+
+    # accept webhooks into an in-process queue and group-commit them in the background
+    WEBHOOK_WRITE_BEHIND: bool = False
+    WEBHOOK_QUEUE_MAX_SIZE: int = 10000
+    WEBHOOK_GROUP_COMMIT_SIZE: int = 500
+    WEBHOOK_GROUP_COMMIT_INTERVAL: float = 0.05
+    WEBHOOK_SPOOL_PATH: str = 'var/spool/webhook'
+    WEBHOOK_SPOOL_FSYNC: bool = True
+
+    # recently seen transaction ids answered as duplicates without a database round trip
+    IDEMPOTENCY_CACHE_SIZE: int = 100000
+    IDEMPOTENCY_SEED_SIZE: int = 10000
+
+    # read-through cache of account balances and user profiles, invalidated on commit
+    CACHE_ENABLED: bool = True
+    CACHE_TTL: float = 5
+    CACHE_MAX_SIZE: int = 10000
+
+    # Prometheus text format on /metrics, summed over the worker processes: each one writes its
+    # samples every METRICS_WRITE_INTERVAL seconds to a directory of the server under METRICS_DIR,
+    # the system temp directory by default
+    METRICS_ENABLED: bool = True
+    METRICS_DIR: str = ''
+    METRICS_WRITE_INTERVAL: float = 1
+
+    # per-request query counts and timings in a Server-Timing header (db, serialize, auth)
+    SQL_PROFILING: bool = True
+    # warn when one request runs the same statement more than this many times, 0 turns it off
+    QUERY_REPEAT_WARNING: int = 10
+    # log statements slower than this with the shape of their parameters, 0 turns it off
+    SLOW_QUERY_MS: float = 200
+    SLOW_QUERY_LOG_LENGTH: int = 2000
+
+    # log records are formatted and written by a thread behind a queue of LOG_QUEUE_SIZE records;
+    # when it is full, DEBUG/INFO records are dropped and warnings wait for room
+    LOG_ASYNC: bool = True
+    LOG_QUEUE_SIZE: int = 10000
+    LOG_FORMAT: Literal['text', 'json'] = 'text'
+    # share of DEBUG/INFO records kept per logger, e.g. {"sanic.root": 0.1, "sanic.access": 0.01}
+    LOG_SAMPLING: Dict[str, float] = {}
+
 
 settings = Settings()
@@ -0,0 +1,22 @@
+import asyncio
+import logging
+
+from webapp.crud import statistics as crud_statistics
+from webapp.db import postgres
+from webapp.models.billing.account_rollup import AccountRollup
+
+
+async def main() -> None:
+    # rebuilds billing.account_rollup from billing.transaction, safe to run on a live database
+    async with postgres.async_session() as session:
+        connection = await session.connection()
+        await connection.run_sync(
+            lambda sync_connection: AccountRollup.__table__.create(sync_connection, checkfirst=True)
+        )
+        buckets = await crud_statistics.rebuild_rollups(session)
+    logging.info('Rebuilt %d account rollup buckets', buckets)
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(main())
@@ -0,0 +1,196 @@
+import json
+import time
+import uuid
+import random
+import asyncio
+import argparse
+import statistics
+from collections import Counter, defaultdict
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import urlsplit
+
+from webapp.utils.signature import make_signature
+
+parser = argparse.ArgumentParser(
+    description='Replay a mix of API calls against a running server as users from scripts/generate_data.py'
+)
+parser.add_argument('--url', default='http://127.0.0.1:8000')
+parser.add_argument('--duration', type=float, default=30, help='Seconds of load after the warm-up logins')
+parser.add_argument('--concurrency', type=int, default=32, help='Virtual users, one keep-alive connection each')
+parser.add_argument(
+    '--mix',
+    default='login=1,accounts=10,transactions=10,webhook=5',
+    help='Relative weights of login, accounts (/account/my), transactions (/transaction/my) and webhook',
+)
+parser.add_argument('--first-user-id', type=int, default=100001, help='Matches --id-offset + 1 of the generator')
+parser.add_argument('--users', type=int, default=1000, help='Virtual users log in as one of this many users')
+parser.add_argument('--password', default='password')
+parser.add_argument('--json', help='Also write the report to this file, to keep as a baseline')
+args = parser.parse_args()
+
+API = '/api/v1'
+
+
+class Connection:
+    # just enough HTTP/1.1 keep-alive client for the JSON endpoints, so the harness needs no extra packages
+    def __init__(self, host: str, port: int) -> None:
+        self.host, self.port = host, port
+        self.reader: Optional[asyncio.StreamReader] = None
+        self.writer: Optional[asyncio.StreamWriter] = None
+
+    async def request(self, method: str, path: str, body: Optional[dict] = None, token: str = '') -> Tuple[int, bytes]:
+        if self.writer is None:
+            self.reader, self.writer = await asyncio.open_connection(self.host, self.port)
+        payload = json.dumps(body).encode() if body is not None else b''
+        head = f'{method} {path} HTTP/1.1\r\nHost: {self.host}\r\nContent-Length: {len(payload)}\r\n'
+        if body is not None:
+            head += 'Content-Type: application/json\r\n'
+        if token:
+            head += f'Authorization: Bearer {token}\r\n'
+        self.writer.write(head.encode() + b'\r\n' + payload)
+        try:
+            return await self._response()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            await self.close()
+            raise
+
+    async def _response(self) -> Tuple[int, bytes]:
+        status = int((await self.reader.readuntil(b'\r\n')).split()[1])
+        headers = {}
+        while (line := await self.reader.readuntil(b'\r\n')) != b'\r\n':
+            name, _, value = line.decode().partition(':')
+            headers[name.strip().lower()] = value.strip()
+        if headers.get('transfer-encoding') == 'chunked':
+            body = b''
+            while size := int(await self.reader.readuntil(b'\r\n'), 16):
+                body += (await self.reader.readexactly(size + 2))[:-2]
+            await self.reader.readuntil(b'\r\n')
+        else:
+            body = await self.reader.readexactly(int(headers.get('content-length', 0)))
+        if headers.get('connection') == 'close':
+            await self.close()
+        return status, body
+
+    async def close(self) -> None:
+        if self.writer is not None:
+            self.writer.close()
+            self.writer = self.reader = None
+
+
+class VirtualUser:
+    def __init__(self, connection: Connection, user_id: int) -> None:
+        self.connection = connection
+        self.user_id = user_id
+        self.token = ''
+        self.account_ids: List[int] = []
+
+    async def login(self) -> int:
+        status, body = await self.connection.request(
+            'POST', f'{API}/auth/login', {'email': f'loaduser{self.user_id}@example.com', 'password': args.password}
+        )
+        if status == 200:
+            self.token = json.loads(body)['access_token']
+        return status
+
+    async def accounts(self) -> int:
+        status, body = await self.connection.request('GET', f'{API}/account/my', token=self.token)
+        if status == 200:
+            self.account_ids = [account['account_id'] for account in json.loads(body)]
+        return status
+
+    async def transactions(self) -> int:
+        status, _ = await self.connection.request('GET', f'{API}/transaction/my', token=self.token)
+        return status
+
+    async def webhook(self) -> int:
+        event = {
+            'transaction_id': str(uuid.uuid4()),
+            'account_id': random.choice(self.account_ids) if self.account_ids else self.user_id,
+            'user_id': self.user_id,
+            'amount': random.randint(1, 1000),
+        }
+        event['signature'] = make_signature(event)
+        status, _ = await self.connection.request('POST', f'{API}/transaction/webhook/payment', event)
+        return status
+
+
+async def timed(latencies: Dict[str, List[float]], statuses: Dict[str, Counter], route: str, call) -> None:
+    started = time.perf_counter()
+    try:
+        status = await call()
+    except (OSError, asyncio.IncompleteReadError, ValueError):
+        status = 'error'
+    latencies[route].append(time.perf_counter() - started)
+    statuses[route][status] += 1
+
+
+async def virtual_user(
+    user: VirtualUser, routes: List[str], weights: List[int], deadline: float, latencies, statuses
+) -> None:
+    await timed(latencies, statuses, 'login', user.login)
+    await timed(latencies, statuses, 'accounts', user.accounts)
+    while time.perf_counter() < deadline:
+        route = random.choices(routes, weights)[0]
+        await timed(latencies, statuses, route, getattr(user, route))
+    await user.connection.close()
+
+
+def report(latencies: Dict[str, List[float]], statuses: Dict[str, Counter], elapsed: float) -> dict:
+    routes = {}
+    for route, samples in sorted(latencies.items()):
+        quantiles = statistics.quantiles(samples, n=100) if len(samples) > 1 else samples * 99
+        routes[route] = {
+            'requests': len(samples),
+            'rps': len(samples) / elapsed,
+            'p50_ms': quantiles[49] * 1000,
+            'p95_ms': quantiles[94] * 1000,
+            'p99_ms': quantiles[98] * 1000,
+            'statuses': {str(status): count for status, count in statuses[route].items()},
+        }
+    total = sum(route['requests'] for route in routes.values())
+    return {
+        'elapsed_s': elapsed,
+        'concurrency': args.concurrency,
+        'mix': args.mix,
+        'rps': total / elapsed,
+        'routes': routes,
+    }
+
+
+async def main() -> None:
+    url = urlsplit(args.url)
+    mix = dict(item.split('=') for item in args.mix.split(','))
+    routes, weights = list(mix), [int(weight) for weight in mix.values()]
+    latencies: Dict[str, List[float]] = defaultdict(list)
+    statuses: Dict[str, Counter] = defaultdict(Counter)
+
+    started = time.perf_counter()
+    deadline = started + args.duration
+    await asyncio.gather(
+        *(
+            virtual_user(
+                VirtualUser(Connection(url.hostname, url.port or 80), args.first_user_id + index % args.users),
+                routes,
+                weights,
+                deadline,
+                latencies,
+                statuses,
+            )
+            for index in range(args.concurrency)
+        )
+    )
+    result = report(latencies, statuses, time.perf_counter() - started)
+
+    print(f'{args.concurrency} virtual users, {result["elapsed_s"]:.1f}s, {result["rps"]:.1f} req/s total')
+    for route, stats in result['routes'].items():
+        print(
+            f'{route:>12}: {stats["requests"]:7d} req {stats["rps"]:8.1f} req/s  p50 {stats["p50_ms"]:7.2f} ms  '
+            f'p95 {stats["p95_ms"]:7.2f} ms  p99 {stats["p99_ms"]:7.2f} ms  {stats["statuses"]}'
+        )
+    if args.json:
+        with open(args.json, 'w') as file:
+            json.dump(result, file, indent=2)
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
@@ -0,0 +1,62 @@
+import time
+import asyncio
+import argparse
+from typing import Awaitable, Callable
+
+from conf import settings
+from webapp.utils.auth.password import hash_password_sync, verify_password, verify_password_sync
+
+parser = argparse.ArgumentParser(description='Concurrent login (bcrypt verification) benchmark')
+parser.add_argument('--logins', type=int, default=64, help='Number of logins per mode')
+parser.add_argument('--concurrency', type=int, default=16, help='Concurrent logins in flight')
+parser.add_argument('--rounds', type=int, default=settings.BCRYPT_ROUNDS, help='bcrypt cost of the stored hash')
+args = parser.parse_args()
+
+
+async def blocking_verify(password: str, hashed: str) -> bool:
+    # what the handlers did before: bcrypt straight on the event loop
+    return verify_password_sync(password, hashed)
+
+
+async def heartbeat(stop: asyncio.Event, interval: float = 0.005) -> float:
+    # longest gap between ticks shows how long other requests would have been stalled
+    loop = asyncio.get_running_loop()
+    worst, last = 0.0, loop.time()
+    while not stop.is_set():
+        await asyncio.sleep(interval)
+        now = loop.time()
+        worst, last = max(worst, now - last - interval), now
+    return worst
+
+
+async def run(verify: Callable[[str, str], Awaitable[bool]], hashed: str) -> tuple[float, float]:
+    semaphore = asyncio.Semaphore(args.concurrency)
+
+    async def login() -> None:
+        async with semaphore:
+            if not await verify('qwerty', hashed):
+                raise SystemExit('Password verification failed, the timings would not be of a real login')
+
+    stop = asyncio.Event()
+    ticker = asyncio.create_task(heartbeat(stop))
+    await asyncio.sleep(0)
+    started = time.perf_counter()
+    await asyncio.gather(*(login() for _ in range(args.logins)))
+    elapsed = time.perf_counter() - started
+    stop.set()
+    return elapsed, await ticker
+
+
+async def main() -> None:
+    hashed = hash_password_sync('qwerty', args.rounds)
+    print(
+        f'{args.logins} logins, concurrency {args.concurrency}, cost {args.rounds}, '
+        f'{settings.PASSWORD_HASH_WORKERS} hash workers'
+    )
+    for name, verify in (('event loop', blocking_verify), ('thread pool', verify_password)):
+        elapsed, stall = await run(verify, hashed)
+        print(f'{name:>12}: {args.logins / elapsed:8.1f} logins/s, worst event loop stall {stall * 1000:8.1f} ms')
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
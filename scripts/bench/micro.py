@@ -0,0 +1,248 @@
+import re
+import sys
+import json
+import time
+import uuid
+import asyncio
+import inspect
+import argparse
+import platform
+import statistics
+import subprocess
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from decimal import Decimal
+from typing import Any, Callable, Dict, List, Optional
+
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from conf import settings
+from webapp.crud import (
+    account as account_crud,
+    statistics as statistics_crud,
+    transaction as transaction_crud,
+    user as user_crud,
+)
+from webapp.crud.loading import LoadProfile
+from webapp.db import postgres
+from webapp.models.billing.transaction import Transaction
+from webapp.schema.account.transaction import TransactionRead
+from webapp.utils.auth.jwt import JwtAuth
+from webapp.utils.auth.password import hash_password_sync, verify_password_sync
+from webapp.utils.serialization import dump_json
+from webapp.utils.signature import check_signature, make_signature
+
+parser = argparse.ArgumentParser(
+    description='Microbenchmarks of the per-request hot paths; save a run and compare later runs against it'
+)
+parser.add_argument('--suite', choices=['cpu', 'db'], nargs='+', default=['cpu', 'db'], help='db needs a seeded DB')
+parser.add_argument('--only', help='Run only the cases whose name matches this regex')
+parser.add_argument('--repeat', type=int, default=7, help='Timed rounds per case, the median is reported')
+parser.add_argument('--min-time', type=float, default=0.2, help='Seconds each round runs for at least')
+parser.add_argument('--rows', type=int, default=1000, help='Length of the serialized TransactionRead lists')
+parser.add_argument('--user-id', type=int, help='User the db cases query, default: the one with most transactions')
+parser.add_argument('--save', help='Write the results to this JSON file')
+parser.add_argument('--compare', help='Results file of an earlier run to compare against')
+parser.add_argument('--threshold', type=float, default=0.1, help='Slowdown that counts as a regression, 0.1 = 10%%')
+
+
+@dataclass
+class Case:
+    name: str
+    fn: Callable[[], Any]
+
+
+def cpu_cases(rows: int) -> List[Case]:
+    event = {'transaction_id': str(uuid.uuid4()), 'account_id': 1, 'user_id': 1, 'amount': Decimal('100.50')}
+    event['signature'] = make_signature(event)
+    # a cache-less instance so decode_token always verifies the signature
+    auth, cached_auth = JwtAuth(settings.JWT_SECRET_SALT), JwtAuth(settings.JWT_SECRET_SALT, cache_size=1)
+    token = auth.create_token(1, 'user')
+    hashed = hash_password_sync('password')
+    started = datetime(2025, 7, 24, 10, 30)
+    transactions = [
+        Transaction(
+            id=i,
+            transaction_id=str(uuid.uuid4()),
+            account_id=i % 7,
+            user_id=i % 3,
+            amount=Decimal(i % 1000) + Decimal('0.50'),
+            timestamp=started + timedelta(seconds=i),
+            signature=uuid.uuid4().hex * 2,
+        )
+        for i in range(rows)
+    ]
+    return [
+        Case('check_signature', lambda: check_signature(event)),
+        Case('jwt.create_token', lambda: auth.create_token(1, 'user')),
+        Case('jwt.decode_token', lambda: auth.decode_token(token)),
+        Case('jwt.decode_token cached', lambda: cached_auth.decode_token(token)),
+        Case(f'verify_password cost {settings.BCRYPT_ROUNDS}', lambda: verify_password_sync('password', hashed)),
+        Case(
+            f'TransactionRead x{rows} model_dump',
+            lambda: [
+                TransactionRead.model_validate(t, from_attributes=True).model_dump(mode='json') for t in transactions
+            ],
+        ),
+        Case(f'TransactionRead x{rows} dump_json', lambda: dump_json(TransactionRead, transactions, many=True)),
+    ]
+
+
+async def db_cases(session: AsyncSession, user_id: Optional[int]) -> List[Case]:
+    if user_id is None:
+        user_id = await session.scalar(
+            select(Transaction.user_id).group_by(Transaction.user_id).order_by(func.count().desc()).limit(1)
+        )
+    if user_id is None:
+        raise SystemExit('No transactions to query, seed the database first (scripts/generate_data.py)')
+    account_id = await session.scalar(
+        select(Transaction.account_id)
+        .where(Transaction.user_id == user_id)
+        .group_by(Transaction.account_id)
+        .order_by(func.count().desc())
+        .limit(1)
+    )
+    user = await user_crud.get_user_by_id(session, user_id, LoadProfile.SUMMARY)
+    page_size = settings.TRANSACTION_PAGE_SIZE
+    _, cursor = await transaction_crud.get_transactions_by_user_id(session, user_id, page_size)
+    session.expunge_all()
+
+    async def query(fn: Callable, *args) -> None:
+        await fn(session, *args)
+        # no identity map carried over between calls, every call pays for loading its rows
+        session.expunge_all()
+
+    return [
+        Case('crud.get_user_by_id summary', lambda: query(user_crud.get_user_by_id, user_id, LoadProfile.SUMMARY)),
+        Case('crud.get_user_by_id detail', lambda: query(user_crud.get_user_by_id, user_id, LoadProfile.DETAIL)),
+        Case('crud.get_user_by_email', lambda: query(user_crud.get_user_by_email, user.email)),
+        Case('crud.get_users_page', lambda: query(user_crud.get_users_page, settings.USER_PAGE_SIZE)),
+        Case('crud.get_accounts_by_user_id summary', lambda: query(account_crud.get_accounts_by_user_id, user_id)),
+        Case(
+            'crud.get_accounts_by_user_id detail',
+            lambda: query(account_crud.get_accounts_by_user_id, user_id, LoadProfile.DETAIL),
+        ),
+        Case('crud.get_account_by_id', lambda: query(account_crud.get_account_by_id, account_id, user_id)),
+        Case(
+            'crud.get_transactions_by_user_id',
+            lambda: query(transaction_crud.get_transactions_by_user_id, user_id, page_size),
+        ),
+        Case(
+            'crud.get_transactions_by_user_id cursor',
+            lambda: query(transaction_crud.get_transactions_by_user_id, user_id, page_size, cursor),
+        ),
+        Case(
+            'crud.get_transactions_by_account_id',
+            lambda: query(transaction_crud.get_transactions_by_account_id, account_id, user_id, page_size),
+        ),
+        Case('crud.get_statistics day', lambda: query(statistics_crud.get_statistics, user_id, 'day')),
+        Case('crud.get_statistics month', lambda: query(statistics_crud.get_statistics, user_id, 'month')),
+        Case(
+            'crud.get_recent_transaction_ids',
+            lambda: query(transaction_crud.get_recent_transaction_ids, settings.IDEMPOTENCY_SEED_SIZE),
+        ),
+    ]
+
+
+async def timed_round(fn: Callable[[], Any], loops: int, is_async: bool) -> float:
+    started = time.perf_counter()
+    if is_async:
+        for _ in range(loops):
+            await fn()
+    else:
+        for _ in range(loops):
+            fn()
+    return time.perf_counter() - started
+
+
+async def measure(case: Case, repeat: int, min_time: float) -> Dict[str, Any]:
+    # the warm-up call also tells coroutines from plain functions
+    result = case.fn()
+    is_async = inspect.isawaitable(result)
+    if is_async:
+        await result
+    # timeit-style: grow the loop count until a round takes min_time, then time repeat rounds of it
+    loops = 1
+    while (elapsed := await timed_round(case.fn, loops, is_async)) < min_time:
+        loops *= max(2, min(10, int(min_time / max(elapsed, 1e-9)) + 1))
+    timings = [await timed_round(case.fn, loops, is_async) / loops for _ in range(repeat)]
+    return {
+        'median_us': statistics.median(timings) * 1e6,
+        'min_us': min(timings) * 1e6,
+        'stdev_us': statistics.stdev(timings) * 1e6 if repeat > 1 else 0.0,
+        'loops': loops,
+        'repeat': repeat,
+    }
+
+
+def git_revision() -> Optional[str]:
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results: Dict[str, dict], baseline: Dict[str, dict], threshold: float) -> List[str]:
+    regressions = []
+    print(f'\n{"case":<45} {"baseline":>12} {"current":>12} {"change":>8}')
+    for name, result in results.items():
+        if name not in baseline:
+            print(f'{name:<45} {"-":>12} {result["median_us"]:10.2f}us {"new":>8}')
+            continue
+        before, after = baseline[name]['median_us'], result['median_us']
+        change = after / before - 1
+        flag = ''
+        if change > threshold:
+            flag = '  REGRESSION'
+            regressions.append(name)
+        print(f'{name:<45} {before:10.2f}us {after:10.2f}us {change:+7.1%}{flag}')
+    return regressions
+
+
+async def main(args: argparse.Namespace) -> None:
+    cases = []
+    if 'cpu' in args.suite:
+        cases += cpu_cases(args.rows)
+    session = None
+    if 'db' in args.suite:
+        # one connection for every case: the pool checkout is measured by scripts/bench/pool.py
+        session = AsyncSession(postgres.engine, expire_on_commit=False)
+        cases += await db_cases(session, args.user_id)
+    if args.only:
+        cases = [case for case in cases if re.search(args.only, case.name)]
+
+    results = {}
+    try:
+        for case in cases:
+            results[case.name] = result = await measure(case, args.repeat, args.min_time)
+            print(
+                f'{case.name:<45} {result["median_us"]:12.2f} us  (min {result["min_us"]:.2f}, '
+                f'stdev {result["stdev_us"]:.2f}, {result["loops"]} loops x {result["repeat"]})'
+            )
+    finally:
+        if session is not None:
+            await session.close()
+        await postgres.engine.dispose()
+
+    if args.save:
+        report = {
+            'created': datetime.now().isoformat(timespec='seconds'),
+            'git': git_revision(),
+            'python': platform.python_version(),
+            'machine': platform.node(),
+            'results': results,
+        }
+        with open(args.save, 'w') as file:
+            json.dump(report, file, indent=2)
+    if args.compare:
+        with open(args.compare) as file:
+            baseline = json.load(file)
+        regressions = compare(results, baseline['results'], args.threshold)
+        if regressions:
+            print(f'\n{len(regressions)} regression(s) over {args.threshold:.0%} against {args.compare}')
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    asyncio.run(main(parser.parse_args()))
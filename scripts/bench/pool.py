@@ -0,0 +1,67 @@
+import time
+import asyncio
+import argparse
+import statistics
+from typing import Awaitable, Callable, Dict, List
+
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from conf import settings
+from webapp.crud import account as crud_account, transaction as crud_transaction
+from webapp.db.postgres import create_engine, create_session
+
+parser = argparse.ArgumentParser(description='Compare statement caching modes on the read endpoints queries')
+parser.add_argument('--user-id', type=int, default=1)
+parser.add_argument('--account-id', type=int, default=1)
+parser.add_argument('--requests', type=int, default=2000, help='Requests per query and mode')
+parser.add_argument('--concurrency', type=int, default=settings.DB_POOL_SIZE)
+args = parser.parse_args()
+
+QUERIES: Dict[str, Callable[[AsyncSession], Awaitable]] = {
+    'account/my': lambda session: crud_account.get_accounts_by_user_id(session, args.user_id),
+    'account/my/<id>': lambda session: crud_account.get_account_by_id(session, args.account_id, args.user_id),
+    'transaction/my': lambda session: crud_transaction.get_transactions_by_user_id(
+        session, args.user_id, settings.TRANSACTION_PAGE_SIZE
+    ),
+    'transaction/my/<id>': lambda session: crud_transaction.get_transactions_by_account_id(
+        session, args.account_id, args.user_id, settings.TRANSACTION_PAGE_SIZE
+    ),
+}
+
+
+async def run(session_factory, query: Callable[[AsyncSession], Awaitable]) -> tuple[float, List[float]]:
+    semaphore = asyncio.Semaphore(args.concurrency)
+    latencies: List[float] = []
+
+    async def request() -> None:
+        async with semaphore:
+            started = time.perf_counter()
+            async with session_factory() as session:
+                await query(session)
+            latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(request() for _ in range(args.requests)))
+    return time.perf_counter() - started, latencies
+
+
+async def main() -> None:
+    for pgbouncer_mode in (False, True):
+        settings.DB_PGBOUNCER_MODE = pgbouncer_mode
+        engine = create_engine()
+        session_factory = create_session(engine)
+        mode = 'pgbouncer (no statement cache)' if pgbouncer_mode else f'cached ({settings.DB_STATEMENT_CACHE_SIZE})'
+        print(f'--- {mode}, pool {settings.DB_POOL_SIZE}+{settings.DB_MAX_OVERFLOW}, concurrency {args.concurrency}')
+        for name, query in QUERIES.items():
+            await run(session_factory, query)  # warm up connections and caches
+            elapsed, latencies = await run(session_factory, query)
+            quantiles = statistics.quantiles(latencies, n=100)
+            print(
+                f'{name:>20}: {args.requests / elapsed:8.1f} req/s, '
+                f'p50 {quantiles[49] * 1000:6.2f} ms, p99 {quantiles[98] * 1000:6.2f} ms'
+            )
+        await engine.dispose()
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
@@ -0,0 +1,143 @@
+import os
+import sys
+import time
+import asyncio
+import hashlib
+import logging
+import argparse
+from pathlib import Path
+from typing import Dict, List
+
+from sqlalchemy import text
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.ext.asyncio import AsyncConnection
+from sqlalchemy.schema import CreateIndex, CreateTable
+
+from conf import settings
+from webapp.db import postgres
+from webapp.models import meta
+from webapp.models.meta import DEFAULT_SCHEMA, RETIRED_INDEXES
+
+STATE_TABLE = f'"{DEFAULT_SCHEMA}"."bootstrap_state"'
+
+parser = argparse.ArgumentParser(
+    description='Migrate the schema and load the fixtures only when they changed, then exec the given command',
+    usage='%(prog)s [--fixtures FILE ...] [--force] [-- command ...]',
+)
+parser.add_argument('--fixtures', nargs='*', default=[], help='Loaded in order, each only while it is new or changed')
+parser.add_argument('--force', action='store_true', help='Migrate and load the fixtures even if nothing changed')
+parser.add_argument('command', nargs=argparse.REMAINDER, help='Replaces this process when bootstrap is done')
+
+
+def schema_version() -> str:
+    # DDL of the models plus the migration inputs that aren't in it: any change re-runs scripts/migrate.py
+    dialect = postgresql.dialect()
+    digest = hashlib.sha256()
+    for table in meta.metadata.sorted_tables:
+        digest.update(str(CreateTable(table).compile(dialect=dialect)).encode())
+        for index in sorted(table.indexes, key=lambda index: index.name):
+            digest.update(str(CreateIndex(index).compile(dialect=dialect)).encode())
+    digest.update(repr((RETIRED_INDEXES, settings.TRANSACTION_PARTITIONING)).encode())
+    return digest.hexdigest()
+
+
+def fixture_version(path: Path) -> str:
+    digest = hashlib.sha256()
+    with open(path, 'rb') as file:
+        while chunk := file.read(1 << 20):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+async def read_state(conn: AsyncConnection) -> Dict[str, str]:
+    await conn.execute(text(f'CREATE SCHEMA IF NOT EXISTS "{DEFAULT_SCHEMA}"'))
+    await conn.execute(
+        text(
+            f'CREATE TABLE IF NOT EXISTS {STATE_TABLE} '
+            '(key text PRIMARY KEY, version text NOT NULL, applied_at timestamp NOT NULL DEFAULT now())'
+        )
+    )
+    result = await conn.execute(text(f'SELECT key, version FROM {STATE_TABLE}'))
+    return dict(result.all())
+
+
+async def save_state(conn: AsyncConnection, key: str, version: str) -> None:
+    await conn.execute(
+        text(
+            f'INSERT INTO {STATE_TABLE} (key, version) VALUES (:key, :version) '
+            'ON CONFLICT (key) DO UPDATE SET version = excluded.version, applied_at = now()'
+        ),
+        {'key': key, 'version': version},
+    )
+
+
+async def bootstrap(fixtures: List[Path], force: bool) -> None:
+    async with postgres.engine.connect() as conn:
+        conn = await conn.execution_options(isolation_level='AUTOCOMMIT')
+        # several containers may start at once, the first one does the work and the others find it done
+        await conn.execute(text('SELECT pg_advisory_lock(hashtext(:key))'), {'key': STATE_TABLE})
+        try:
+            await apply(conn, fixtures, force)
+        finally:
+            await conn.execute(text('SELECT pg_advisory_unlock(hashtext(:key))'), {'key': STATE_TABLE})
+
+
+async def apply(conn: AsyncConnection, fixtures: List[Path], force: bool) -> None:
+    state = await read_state(conn)
+
+    version = schema_version()
+    if force or state.get('schema') != version:
+        # imported on demand, an up-to-date start doesn't pay for them
+        from scripts import migrate
+
+        logging.info('Schema changed, migrating')
+        await migrate.main(concurrently=False)
+        await save_state(conn, 'schema', version)
+    else:
+        logging.info('Schema is current')
+
+    loaded = False
+    for path in fixtures:
+        key, version = f'fixture:{path.name}', fixture_version(path)
+        if not force and state.get(key) == version:
+            logging.info('Fixture %s already applied', path)
+            continue
+        from scripts import load_data
+
+        await load_data.load(path, load_data.parser.parse_args([str(path)]))
+        await save_state(conn, key, version)
+        loaded = True
+
+    if loaded:
+        from scripts import backfill_rollups
+
+        # fixtures bypass the ingestion path, rebuild the rollups from the loaded transactions
+        await backfill_rollups.main()
+
+
+async def main(fixtures: List[Path], force: bool) -> None:
+    try:
+        await bootstrap(fixtures, force)
+    finally:
+        await postgres.engine.dispose()
+
+
+def exec_command(command: List[str]) -> None:
+    if command and command[0] == '--':
+        command = command[1:]
+    if not command:
+        return
+    # the server becomes this process (PID 1 in the container) and gets the signals directly
+    logging.info('Starting %s', ' '.join(command))
+    sys.stdout.flush()
+    sys.stderr.flush()
+    os.execvp(command[0], command)
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(message)s')
+    args = parser.parse_args()
+    started = time.perf_counter()
+    asyncio.run(main([Path(fixture) for fixture in args.fixtures], args.force))
+    logging.info('Bootstrap done in %.2fs', time.perf_counter() - started)
+    exec_command(args.command)
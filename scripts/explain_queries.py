@@ -0,0 +1,137 @@
+import sys
+import asyncio
+import argparse
+from datetime import datetime
+from typing import Awaitable, Callable, Dict, List, Tuple
+from uuid import uuid4
+
+from sqlalchemy import event, func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from conf import settings
+from webapp.crud import (
+    account as crud_account,
+    statistics as crud_statistics,
+    transaction as crud_transaction,
+    user as crud_user,
+)
+from webapp.crud.loading import LoadProfile
+from webapp.db import postgres
+from webapp.models.billing.transaction import Transaction
+from webapp.utils.pagination import encode_cursor
+
+parser = argparse.ArgumentParser(description='Print the EXPLAIN plan of every statement the CRUD queries issue')
+parser.add_argument('--user-id', type=int, help='Defaults to the user with the most transactions')
+parser.add_argument('--account-id', type=int, help="Defaults to that user's busiest account")
+parser.add_argument('--analyze', action='store_true', help='EXPLAIN ANALYZE, writes are rolled back')
+parser.add_argument(
+    '--no-seqscan',
+    action='store_true',
+    help='Plan with enable_seqscan off and exit 1 if a billing table is still scanned sequentially (missing index)',
+)
+args = parser.parse_args()
+
+
+def queries(user_id: int, account_id: int) -> Dict[str, Callable[[AsyncSession], Awaitable]]:
+    page_size = settings.TRANSACTION_PAGE_SIZE
+    cursor = encode_cursor(datetime.now(), 2**31 - 1)
+    event_data = {
+        'transaction_id': uuid4(),
+        'account_id': account_id,
+        'user_id': user_id,
+        'amount': 1,
+        'signature': '',
+    }
+
+    async def export(session: AsyncSession) -> None:
+        async for _ in crud_transaction.stream_transactions(session, user_id):
+            break
+
+    return {
+        'account/my': lambda session: crud_account.get_accounts_by_user_id(session, user_id),
+        'account/my/<id>': lambda session: crud_account.get_account_by_id(session, account_id, user_id),
+        'account/my/statistics': lambda session: crud_statistics.get_statistics(session, user_id, 'month'),
+        'user/me': lambda session: crud_user.get_user_by_id(session, user_id, LoadProfile.DETAIL),
+        'transaction/my': lambda session: crud_transaction.get_transactions_by_user_id(session, user_id, page_size),
+        'transaction/my?cursor': lambda session: crud_transaction.get_transactions_by_user_id(
+            session, user_id, page_size, cursor
+        ),
+        'transaction/my/<id>': lambda session: crud_transaction.get_transactions_by_account_id(
+            session, account_id, user_id, page_size
+        ),
+        'transaction/my/export': export,
+        'webhook/payment': lambda session: session.execute(crud_transaction._ingest_stmt([event_data], datetime.now())),
+    }
+
+
+async def capture(query: Callable[[AsyncSession], Awaitable]) -> List[Tuple[str, tuple]]:
+    statements: List[Tuple[str, tuple]] = []
+
+    def record(conn, cursor, statement, parameters, context, executemany) -> None:
+        statements.append((statement, parameters))
+
+    event.listen(postgres.engine.sync_engine, 'before_cursor_execute', record)
+    try:
+        async with postgres.async_session() as session:
+            await query(session)
+            await session.rollback()
+    finally:
+        event.remove(postgres.engine.sync_engine, 'before_cursor_execute', record)
+    return statements
+
+
+async def explain(statement: str, parameters: tuple) -> List[str]:
+    options = 'ANALYZE, BUFFERS' if args.analyze else 'COSTS'
+    async with postgres.engine.connect() as conn:
+        raw_connection = await conn.get_raw_connection()
+        driver = raw_connection.driver_connection
+        transaction = driver.transaction()
+        await transaction.start()
+        try:
+            if args.no_seqscan:
+                await driver.execute('SET LOCAL enable_seqscan = off')
+            rows = await driver.fetch(f'EXPLAIN ({options}) {statement}', *parameters)
+        finally:
+            await transaction.rollback()
+    return [row[0] for row in rows]
+
+
+async def busiest() -> Tuple[int, int]:
+    stmt = (
+        select(Transaction.user_id, Transaction.account_id)
+        .group_by(Transaction.user_id, Transaction.account_id)
+        .order_by(func.count().desc())
+        .limit(1)
+    )
+    async with postgres.async_session() as session:
+        row = (await session.execute(stmt)).first()
+    return (row.user_id, row.account_id) if row else (1, 1)
+
+
+async def main() -> int:
+    user_id, account_id = args.user_id, args.account_id
+    if user_id is None or account_id is None:
+        busiest_user_id, busiest_account_id = await busiest()
+        user_id = busiest_user_id if user_id is None else user_id
+        account_id = busiest_account_id if account_id is None else account_id
+    print(f'-- user_id={user_id} account_id={account_id}')
+
+    seqscans = []
+    for name, query in queries(user_id, account_id).items():
+        for number, (statement, parameters) in enumerate(await capture(query), start=1):
+            plan = await explain(statement, parameters)
+            print(f'\n-- {name} [{number}]\n{statement}\n')
+            print('\n'.join(plan))
+            seqscans += [(name, line.strip()) for line in plan if 'Seq Scan on ' in line]
+    await postgres.engine.dispose()
+
+    if args.no_seqscan and seqscans:
+        print('\n-- sequential scans:', file=sys.stderr)
+        for name, line in seqscans:
+            print(f'{name}: {line}', file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(asyncio.run(main()))
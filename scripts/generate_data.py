@@ -0,0 +1,95 @@
+import json
+import uuid
+import random
+import logging
+import argparse
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Dict
+
+from conf import settings
+from webapp.utils.auth.password import hash_password_sync
+from webapp.utils.signature import make_signature
+
+parser = argparse.ArgumentParser(
+    description='Write NDJSON fixtures for scripts/load_data.py: users, accounts and signed transactions'
+)
+parser.add_argument('--users', type=int, default=1000)
+parser.add_argument('--accounts', type=int, default=3000, help='Spread over the users round-robin')
+parser.add_argument('--transactions', type=int, default=1000000, help='Spread over the accounts at random')
+parser.add_argument('--days', type=int, default=365, help='Transaction timestamps cover the last N days')
+parser.add_argument('--id-offset', type=int, default=100000, help='User and account ids start after this value')
+parser.add_argument('--password', default='password', help='Password of every generated user')
+parser.add_argument('--rounds', type=int, default=settings.BCRYPT_ROUNDS, help='bcrypt cost of the password hash')
+parser.add_argument('--seed', type=int, default=0)
+parser.add_argument('--out', default='var/fixtures')
+
+
+def user_email(user_id: int) -> str:
+    return f'loaduser{user_id}@example.com'
+
+
+def main(args: argparse.Namespace) -> None:
+    rng = random.Random(args.seed)
+    out = Path(args.out)
+    out.mkdir(parents=True, exist_ok=True)
+    now = datetime.now().replace(microsecond=0)
+    user_ids = range(args.id_offset + 1, args.id_offset + args.users + 1)
+    account_ids = range(args.id_offset + 1, args.id_offset + args.accounts + 1)
+    owners = {account_id: user_ids[index % len(user_ids)] for index, account_id in enumerate(account_ids)}
+    balances: Dict[int, int] = dict.fromkeys(account_ids, 0)
+
+    # one hash for everybody, bcrypt per user would dominate the run time
+    hashed_password = hash_password_sync(args.password, args.rounds)
+    with open(out / 'billing.user.ndjson', 'w') as file:
+        for user_id in user_ids:
+            user = {
+                'user_id': user_id,
+                'username': f'loaduser{user_id}',
+                'email': user_email(user_id),
+                'full_name': f'Load User {user_id}',
+                'hashed_password': hashed_password,
+                'role': 'user',
+            }
+            file.write(json.dumps(user) + '\n')
+
+    with open(out / 'billing.transaction.ndjson', 'w') as file:
+        for _ in range(args.transactions):
+            account_id = rng.choice(account_ids)
+            # whole cents as a 2-decimal number, str() of it is what the webhook signature covers
+            cents = rng.randint(100, 100000)
+            transaction = {
+                'transaction_id': str(uuid.UUID(int=rng.getrandbits(128), version=4)),
+                'account_id': account_id,
+                'user_id': owners[account_id],
+                'amount': cents // 100 if cents % 100 == 0 else cents / 100,
+                'timestamp': (now - timedelta(seconds=rng.randrange(args.days * 86400))).isoformat(),
+            }
+            transaction['signature'] = make_signature(transaction)
+            balances[account_id] += cents
+            file.write(json.dumps(transaction) + '\n')
+
+    with open(out / 'billing.account.ndjson', 'w') as file:
+        for account_id in account_ids:
+            account = {
+                'account_id': account_id,
+                'user_id': owners[account_id],
+                'account_name': f'Account {account_id}',
+                'account_date': (now - timedelta(days=args.days)).isoformat(),
+                'balance': balances[account_id] / 100,
+            }
+            file.write(json.dumps(account) + '\n')
+
+    logging.info(
+        'Wrote %d users, %d accounts and %d transactions to %s. Load them in this order with scripts/load_data.py, '
+        'then run scripts/backfill_rollups.py',
+        args.users,
+        args.accounts,
+        args.transactions,
+        out,
+    )
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    main(parser.parse_args())
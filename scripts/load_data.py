@@ -1,53 +1,248 @@
+import os
+import re
+import csv
 import json
+import time
 import asyncio
+import logging
 import argparse
-from datetime import datetime
+from datetime import date, datetime, timezone
+from decimal import Decimal
 from pathlib import Path
-from typing import List
+from typing import Any, Callable, Dict, Iterator, List, TextIO
 
-from sqlalchemy import insert
-from sqlalchemy.exc import IntegrityError  # Добавлено
+from sqlalchemy import Table, func, select, text
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.ext.asyncio import AsyncSession
 
-from webapp.db.postgres import async_session
+from conf import settings
+from webapp.db import postgres
+from webapp.models.billing.transaction import Transaction
+from webapp.models.billing.transaction_key import TransactionKey
 from webapp.models.meta import metadata
 
-parser = argparse.ArgumentParser()
+SEPARATORS = re.compile(r'[\s,]*')
+
+parser = argparse.ArgumentParser(
+    description='Load fixtures named <schema>.<table>.<json|ndjson|csv> chunk by chunk, resuming interrupted loads'
+)
 parser.add_argument('fixtures', nargs='+', help='<Required> Set flag')
-args = parser.parse_args()
+parser.add_argument('--format', choices=['auto', 'json', 'ndjson', 'csv'], default='auto', help='auto: by suffix')
+parser.add_argument('--chunk-size', type=int, default=5000, help='Rows per committed chunk')
+parser.add_argument(
+    '--mode',
+    choices=['insert', 'copy'],
+    default='insert',
+    help='insert: batched INSERT ... ON CONFLICT DO NOTHING, safe to re-run; '
+    'copy: COPY through asyncpg, fastest, fails on rows that already exist',
+)
+parser.add_argument('--checkpoint-dir', default='var/load_data', help='Where the last committed chunk is recorded')
+
+
+def _to_datetime(value: Any) -> Any:
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value)
+    if isinstance(value, datetime) and value.tzinfo is not None:
+        # timestamps are stored without time zone, in UTC
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+
+def _converter(python_type: type) -> Callable[[Any], Any]:
+    if python_type is datetime:
+        return _to_datetime
+    if python_type is date:
+        return lambda value: date.fromisoformat(value) if isinstance(value, str) else value
+    if python_type is bool:
+        return lambda value: value.lower() in ('1', 'true', 't', 'yes') if isinstance(value, str) else value
+    if python_type in (int, float, Decimal):
+        # Decimal via str keeps JSON floats like 0.1 exact to what the file says
+        return lambda value: python_type(str(value)) if isinstance(value, (str, float, int)) else value
+    return lambda value: value
+
+
+def row_converter(table: Table) -> Callable[[Dict[str, Any]], Dict[str, Any]]:
+    converters = {}
+    for column in table.c:
+        try:
+            converters[column.key] = (_converter(column.type.python_type), column.type.python_type is not str)
+        except NotImplementedError:
+            converters[column.key] = (lambda value: value, False)
+
+    def convert(row: Dict[str, Any]) -> Dict[str, Any]:
+        converted = {}
+        for key, value in row.items():
+            if key not in converters:
+                raise ValueError(f'Unknown column {table.fullname}.{key}')
+            convert_value, empty_is_null = converters[key]
+            if value is None or (empty_is_null and value == ''):
+                converted[key] = None
+            else:
+                converted[key] = convert_value(value)
+        return converted
+
+    return convert
+
+
+def iter_json_array(file: TextIO, buffer_size: int = 1 << 16) -> Iterator[dict]:
+    # [ {...}, {...} ] decoded one object at a time, the file is never held in memory at once
+    decoder = json.JSONDecoder()
+    buffer = file.read(buffer_size).lstrip()
+    if not buffer.startswith('['):
+        raise ValueError('Expected a JSON array')
+    pos = 1
+    while True:
+        pos = SEPARATORS.match(buffer, pos).end()
+        if buffer.startswith(']', pos):
+            return
+        try:
+            row, pos = decoder.raw_decode(buffer, pos)
+        except json.JSONDecodeError:
+            # the next object is cut off at the end of the buffer
+            chunk = file.read(buffer_size)
+            if not chunk:
+                raise
+            buffer, pos = buffer[pos:] + chunk, 0
+            continue
+        yield row
+
+
+def iter_rows(path: Path, file_format: str) -> Iterator[dict]:
+    if file_format == 'auto':
+        file_format = path.suffix.lstrip('.')
+    with open(path, newline='' if file_format == 'csv' else None) as file:
+        if file_format == 'json':
+            yield from iter_json_array(file)
+        elif file_format == 'ndjson':
+            yield from (json.loads(line) for line in file if line.strip())
+        elif file_format == 'csv':
+            yield from csv.DictReader(file)
+        else:
+            raise ValueError(f'Unsupported fixture format: {path}')
+
+
+class Checkpoint:
+    # number of rows of a fixture already committed, valid only for the same file contents
+    def __init__(self, directory: str, path: Path) -> None:
+        self.path = Path(directory) / f'{path.name}.checkpoint'
+        stat = path.stat()
+        self.source = {'file': str(path.resolve()), 'size': stat.st_size, 'mtime': stat.st_mtime}
+
+    def load(self) -> int:
+        if not self.path.exists():
+            return 0
+        state = json.loads(self.path.read_text())
+        if state.get('source') != self.source:
+            logging.warning('Ignoring checkpoint %s: the fixture has changed', self.path)
+            return 0
+        return state['rows']
+
+    def save(self, rows: int) -> None:
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.path.with_suffix('.tmp')
+        tmp_path.write_text(json.dumps({'source': self.source, 'rows': rows}))
+        os.replace(tmp_path, self.path)
+
+    def clear(self) -> None:
+        self.path.unlink(missing_ok=True)
+
+
+async def register_transaction_ids(session: AsyncSession, values: list) -> list:
+    # the partitioned table can't reject duplicate transaction ids by itself, see TransactionKey
+    registered = set()
+    for start in range(0, len(values), 10000):
+        result = await session.execute(
+            pg_insert(TransactionKey)
+            .values(
+                [
+                    {'transaction_id': row['transaction_id'], 'user_id': row['user_id']}
+                    for row in values[start : start + 10000]
+                ]
+            )
+            .on_conflict_do_nothing()
+            .returning(TransactionKey.transaction_id)
+        )
+        registered.update(result.scalars())
+    return [row for row in values if row['transaction_id'] in registered]
+
+
+async def write_chunk(session: AsyncSession, table: Table, rows: List[dict], mode: str) -> int:
+    if settings.TRANSACTION_PARTITIONING and table is Transaction.__table__:
+        rows = await register_transaction_ids(session, rows)
+    if not rows:
+        return 0
+    if mode == 'insert':
+        written = 0
+        # a statement can carry at most 32767 bind parameters
+        batch_size = max(1, 32767 // len(rows[0]))
+        for start in range(0, len(rows), batch_size):
+            batch = rows[start : start + batch_size]
+            result = await session.execute(pg_insert(table).values(batch).on_conflict_do_nothing())
+            written += result.rowcount
+        return written
+    columns = list(rows[0])
+    connection = await session.connection()
+    raw_connection = await connection.get_raw_connection()
+    await raw_connection.driver_connection.copy_records_to_table(
+        table.name,
+        schema_name=table.schema,
+        columns=columns,
+        records=[tuple(row.get(column) for column in columns) for row in rows],
+    )
+    return len(rows)
 
 
-def parse_dates_in_values(values: list, datetime_fields: set = None):
-    """Преобразует ISO-строки в datetime объекты"""
-    datetime_fields = datetime_fields or {'timestamp', 'account_date'}
+async def sync_sequences(session: AsyncSession, table: Table) -> None:
+    # rows that came with explicit ids would otherwise collide with the next generated one
+    for column in table.primary_key.columns:
+        sequence = await session.scalar(
+            text('SELECT pg_get_serial_sequence(:table, :column)'),
+            {'table': f'"{table.schema}"."{table.name}"', 'column': column.name},
+        )
+        if sequence:
+            last = await session.scalar(select(func.max(column)))
+            await session.execute(
+                text('SELECT setval(:sequence, :value, false)'), {'sequence': sequence, 'value': (last or 0) + 1}
+            )
+    await session.commit()
 
-    for row in values:
-        for key in row:
-            if key in datetime_fields and isinstance(row[key], str):
-                try:
-                    row[key] = datetime.fromisoformat(row[key].replace('Z', '').split('+')[0])
-                except Exception:
-                    pass
 
+async def load(path: Path, args: argparse.Namespace) -> None:
+    table = metadata.tables[path.name.rsplit('.', 1)[0]]
+    convert = row_converter(table)
+    checkpoint = Checkpoint(args.checkpoint_dir, path)
+    skip = checkpoint.load()
+    if skip:
+        logging.info('%s: resuming after %d committed rows', path, skip)
 
-async def main(fixtures: List[str]) -> None:
-    for fixture in fixtures:
-        fixture_path = Path(fixture)
-        model = metadata.tables[fixture_path.stem]
+    done, written = skip, 0
+    started = time.perf_counter()
+    rows = iter_rows(path, args.format)
+    for _ in range(skip):
+        next(rows, None)
+    while True:
+        chunk = [convert(row) for _, row in zip(range(args.chunk_size), rows)]
+        if not chunk:
+            break
+        async with postgres.async_session() as session:
+            written += await write_chunk(session, table, chunk, args.mode)
+            await session.commit()
+        done += len(chunk)
+        checkpoint.save(done)
+        elapsed = time.perf_counter() - started
+        logging.info('%s: %d rows read, %d written, %.0f rows/s', path, done, written, (done - skip) / elapsed)
 
-        with open(fixture_path, 'r') as file:
-            values = json.load(file)
+    async with postgres.async_session() as session:
+        await sync_sequences(session, table)
+    checkpoint.clear()
+    logging.info('%s: done, %d rows written in %.1fs', path, written, time.perf_counter() - started)
 
-        parse_dates_in_values(values)
 
-        async with async_session() as session:
-            try:
-                await session.execute(insert(model).values(values))
-                await session.commit()
-            except IntegrityError:
-                # Просто игнорируем ошибку, если запись уже существует
-                await session.rollback()
-                pass
+async def main(args: argparse.Namespace) -> None:
+    for fixture in args.fixtures:
+        await load(Path(fixture), args)
 
 
 if __name__ == '__main__':
-    asyncio.run(main(args.fixtures))
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(message)s')
+    asyncio.run(main(parser.parse_args()))
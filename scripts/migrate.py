@@ -1,19 +1,81 @@
 import asyncio
 import logging
+import argparse
 
+from sqlalchemy import text
 from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncConnection
+from sqlalchemy.schema import CreateIndex
 
-from webapp.db.postgres import engine
+from conf import settings
+from webapp.db import postgres
+from webapp.db.partitioning import ensure_partitions, is_partitioned
 from webapp.models import meta
+from webapp.models.billing.transaction import Transaction
+from webapp.models.meta import DEFAULT_SCHEMA, RETIRED_INDEXES
 
+parser = argparse.ArgumentParser()
+parser.add_argument(
+    '--concurrently',
+    action='store_true',
+    help='Build missing indexes with CREATE INDEX CONCURRENTLY, without blocking writes',
+)
 
-async def main() -> None:
+
+async def drop_invalid_indexes(conn: AsyncConnection, concurrently: bool) -> None:
+    # an interrupted concurrent build leaves an INVALID index behind that IF NOT EXISTS would skip
+    result = await conn.execute(
+        text(
+            'SELECT c.relname FROM pg_index i '
+            'JOIN pg_class c ON c.oid = i.indexrelid '
+            'JOIN pg_namespace n ON n.oid = c.relnamespace '
+            'WHERE n.nspname = :schema AND NOT i.indisvalid'
+        ),
+        {'schema': DEFAULT_SCHEMA},
+    )
+    for name in result.scalars():
+        logging.warning('Dropping invalid index %s', name)
+        await conn.execute(text(f'DROP INDEX {"CONCURRENTLY " if concurrently else ""}"{DEFAULT_SCHEMA}"."{name}"'))
+
+
+async def create_indexes(concurrently: bool) -> None:
+    # create_all builds indexes only together with new tables, add the ones missing on existing tables
+    async with postgres.engine.connect() as conn:
+        if concurrently:
+            # CONCURRENTLY can't run inside a transaction block
+            conn = await conn.execution_options(isolation_level='AUTOCOMMIT')
+        await drop_invalid_indexes(conn, concurrently)
+        for name in RETIRED_INDEXES:
+            await conn.execute(
+                text(f'DROP INDEX {"CONCURRENTLY " if concurrently else ""}IF EXISTS "{DEFAULT_SCHEMA}"."{name}"')
+            )
+        partitioned = await is_partitioned(conn)
+        for table in meta.metadata.sorted_tables:
+            for index in sorted(table.indexes, key=lambda index: index.name):
+                # not supported on a partitioned table, an index on the parent cascades to the partitions
+                on_partitioned = partitioned and table is Transaction.__table__
+                index.dialect_kwargs['postgresql_concurrently'] = concurrently and not on_partitioned
+                await conn.execute(CreateIndex(index, if_not_exists=True))
+        await conn.commit()
+
+
+async def main(concurrently: bool) -> None:
     try:
-        async with engine.begin() as conn:
+        async with postgres.engine.begin() as conn:
             await conn.run_sync(meta.metadata.create_all)
     except IntegrityError:
         logging.exception('Already exists')
+    await create_indexes(concurrently)
+    if settings.TRANSACTION_PARTITIONING:
+        async with postgres.engine.begin() as conn:
+            if not await is_partitioned(conn):
+                logging.warning('billing.transaction is not partitioned yet, run scripts/partition_transactions.py')
+                return
+            created = await ensure_partitions(conn, settings.TRANSACTION_PARTITIONS_AHEAD)
+        logging.info('Created transaction partitions: %s', ', '.join(created) or 'none')
 
 
 if __name__ == '__main__':
-    asyncio.run(main())
+    logging.basicConfig(level=logging.INFO)
+    args = parser.parse_args()
+    asyncio.run(main(args.concurrently))
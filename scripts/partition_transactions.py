@@ -0,0 +1,82 @@
+import asyncio
+import logging
+import argparse
+
+from sqlalchemy import func, select, text
+
+from conf import settings
+from webapp.db import postgres
+from webapp.db.partitioning import SCHEMA, TABLE, ensure_partitions, is_partitioned
+from webapp.models.billing.transaction import Transaction
+from webapp.models.billing.transaction_key import TransactionKey
+
+OLD_TABLE = f'{TABLE}_unpartitioned'
+
+parser = argparse.ArgumentParser(
+    description='Move billing.transaction into a table partitioned by month. Writes to the table are blocked '
+    'while the rows are copied, reads are not.'
+)
+parser.add_argument('--drop-old', action='store_true', help=f'Drop {SCHEMA}.{OLD_TABLE} once the copy is committed')
+
+
+async def main(drop_old: bool) -> None:
+    if not settings.TRANSACTION_PARTITIONING:
+        raise SystemExit('Set TRANSACTION_PARTITIONING=true, the models describe the unpartitioned table otherwise')
+
+    async with postgres.engine.begin() as conn:
+        if await is_partitioned(conn):
+            logging.info('%s.%s is already partitioned', SCHEMA, TABLE)
+            return
+
+        await conn.execute(text(f'LOCK TABLE "{SCHEMA}"."{TABLE}" IN EXCLUSIVE MODE'))
+        # move the old table, its indexes and its id sequence out of the way of the new names
+        sequence = await conn.scalar(
+            text('SELECT pg_get_serial_sequence(:table, :column)'), {'table': f'{SCHEMA}.{TABLE}', 'column': 'id'}
+        )
+        indexes = (
+            (
+                await conn.execute(
+                    text('SELECT indexname FROM pg_indexes WHERE schemaname = :schema AND tablename = :table'),
+                    {'schema': SCHEMA, 'table': TABLE},
+                )
+            )
+            .scalars()
+            .all()
+        )
+        await conn.execute(text(f'ALTER TABLE "{SCHEMA}"."{TABLE}" RENAME TO "{OLD_TABLE}"'))
+        for index in indexes:
+            await conn.execute(text(f'ALTER INDEX "{SCHEMA}"."{index}" RENAME TO "{index}_old"'))
+        if sequence:
+            await conn.execute(text(f'ALTER SEQUENCE {sequence} RENAME TO "{OLD_TABLE}_id_seq"'))
+
+        await conn.run_sync(lambda sync_conn: TransactionKey.__table__.create(sync_conn, checkfirst=True))
+        await conn.run_sync(lambda sync_conn: Transaction.__table__.create(sync_conn))
+        first = await conn.scalar(text(f'SELECT min(timestamp) FROM "{SCHEMA}"."{OLD_TABLE}"'))
+        created = await ensure_partitions(conn, settings.TRANSACTION_PARTITIONS_AHEAD, first.date() if first else None)
+        logging.info('Created %d partitions', len(created))
+
+        columns = ', '.join(f'"{key}"' for key in Transaction.__table__.c.keys())
+        result = await conn.execute(
+            text(f'INSERT INTO "{SCHEMA}"."{TABLE}" ({columns}) SELECT {columns} FROM "{SCHEMA}"."{OLD_TABLE}"')
+        )
+        logging.info('Copied %d transactions', result.rowcount)
+        await conn.execute(
+            text(
+                f'INSERT INTO "{SCHEMA}"."{TransactionKey.__tablename__}" (transaction_id, user_id) '
+                f'SELECT transaction_id, user_id FROM "{SCHEMA}"."{TABLE}" ON CONFLICT DO NOTHING'
+            )
+        )
+        last_id = await conn.scalar(select(func.max(Transaction.id)))
+        await conn.execute(
+            text('SELECT setval(pg_get_serial_sequence(:table, :column), :value, false)'),
+            {'table': f'{SCHEMA}.{TABLE}', 'column': 'id', 'value': (last_id or 0) + 1},
+        )
+        if drop_old:
+            await conn.execute(text(f'DROP TABLE "{SCHEMA}"."{OLD_TABLE}"'))
+    logging.info('%s.%s is partitioned by month', SCHEMA, TABLE)
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    args = parser.parse_args()
+    asyncio.run(main(args.drop_old))
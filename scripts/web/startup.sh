@@ -2,13 +2,12 @@
 
 echo "Start service"
 
-# migrate database
-python scripts/migrate.py
-
-# load fixtures
-python scripts/load_data.py fixture/billing/billing.user.json
-python scripts/load_data.py fixture/billing/billing.account.json
-python scripts/load_data.py fixture/billing/billing.transaction.json
-
-# start web server
-sanic webapp.server:create_app --host=0.0.0.0 --port=8000
+# one interpreter migrates the schema and loads the fixtures only when they changed since the last start,
+# rebuilds the rollups after loading, then becomes the web server
+# (one process per worker, each with its own engine and pool, see DB_CONNECTION_BUDGET in conf/config.py)
+exec python scripts/bootstrap.py \
+    --fixtures \
+        fixture/billing/billing.user.json \
+        fixture/billing/billing.account.json \
+        fixture/billing/billing.transaction.json \
+    -- sanic webapp.server:create_app --host=0.0.0.0 --port=8000 --workers="${WEB_WORKERS:-1}"
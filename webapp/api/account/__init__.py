@@ -1 +1 @@
-from . import account, transaction
+from . import account, statistics, transaction
@@ -6,6 +6,7 @@ from webapp import ErrorResponse, protected
 from webapp.api.account.router import bp_account
 from webapp.crud import account as crud_account
 from webapp.schema.account.account import AccountRead, AccountsReadShort, AccountUpdate
+from webapp.utils.serialization import json_response
 
 
 @bp_account.get('/my/<account_id:int>')
@@ -20,14 +21,14 @@ async def get_account(request: Request, account_id: int):
     logger.info('Fetching account. User: %s, Account ID: %d', user, account_id)
 
     async with request.ctx.session as session:
-        account = await crud_account.get_account_by_id(session, account_id, user['user_id'])
-        account = AccountRead.model_validate(account, from_attributes=True).model_dump(mode='json')
+        account = await crud_account.get_cached_account(session, account_id, user['user_id'])
         if not account:
             logger.warning('Account not found. Account ID: %d, User ID: %d', account_id, user['user_id'])
             return json({'error': 'Account not found'}, status=404)
+        response = json_response(AccountRead, account)
 
     logger.info('Account fetched successfully by user %d. Account ID: %d', user['user_id'], account_id)
-    return json(account)
+    return response
 
 
 @bp_account.patch('/my/<account_id:int>/update')
@@ -46,12 +47,11 @@ async def update_account(request: Request, account_id: int):
         account_data = AccountUpdate.model_validate(request.json, from_attributes=True)
         try:
             account = await crud_account.update_account(session, account_id, account_data, user['user_id'])
-            account = AccountRead.model_validate(account, from_attributes=True).model_dump(mode='json')
         except ValueError as e:
             logger.error('Error updating account: %s', str(e))
             return json({'error': str(e)}, status=400)
     logger.info('Account updated successfully. User: %s, Account ID: %d', user, account_id)
-    return json(account)
+    return json_response(AccountRead, account)
 
 
 @bp_account.get('/my')
@@ -66,16 +66,11 @@ async def get_my_accounts(request: Request):
     logger.info('Fetching all accounts for user: %s', user)
 
     async with request.ctx.session as session:
-        accounts = await crud_account.get_accounts_by_user_id(session, user['user_id'])
+        accounts = await crud_account.get_cached_accounts(session, user['user_id'])
         logger.debug('Accounts fetched: %s', accounts)
     if not accounts:
         logger.warning('No accounts found for user: %d', user['user_id'])
         return json({'error': 'No accounts found for this user'}, status=404)
 
     logger.info('Accounts returned for user: %d', user['user_id'])
-    return json(
-        [
-            AccountsReadShort.model_validate(account, from_attributes=True).model_dump(mode='json')
-            for account in accounts
-        ]
-    )
+    return json_response(AccountsReadShort, accounts, many=True)
@@ -0,0 +1,39 @@
+from sanic import Request, json
+from sanic.log import logger
+from sanic_ext.extensions.openapi import openapi
+
+from webapp import ErrorResponse, protected
+from webapp.api.account.router import bp_account
+from webapp.crud import statistics as crud_statistics
+from webapp.schema.account.statistics import Statistics, StatisticsQuery
+from webapp.utils.serialization import json_response
+
+
+@bp_account.get('/my/statistics')
+@openapi.secured('token')
+@openapi.description('Inflow totals per day or month, for one account or all accounts of the authenticated user')
+@openapi.parameter('period', str, description='Bucket size: day (default) or month')
+@openapi.parameter('from', str, description='First day (inclusive), YYYY-MM-DD')
+@openapi.parameter('to', str, description='Last day (exclusive), YYYY-MM-DD')
+@openapi.parameter('account_id', int, description='Limit the totals to one account')
+@openapi.response(status=200, content=Statistics, description='Totals per bucket, oldest first')
+@openapi.response(status=400, content=ErrorResponse, description='Invalid query parameters')
+@openapi.response(status=401, content=ErrorResponse, description='User not authenticated')
+@protected()
+async def get_statistics(request: Request):
+    user = request.ctx.user
+    logger.info('Fetching statistics for user: %d', user['user_id'])
+
+    try:
+        query = StatisticsQuery.model_validate({key: request.args.get(key) for key in request.args})
+    except ValueError as e:
+        logger.warning('Invalid statistics query for user %d: %s', user['user_id'], str(e))
+        return json({'error': str(e)}, status=400)
+
+    async with request.ctx.session as session:
+        buckets = await crud_statistics.get_statistics(
+            session, user['user_id'], query.period, query.date_from, query.date_to, query.account_id
+        )
+
+    logger.info('Statistics returned for user %d: %d buckets', user['user_id'], len(buckets))
+    return json_response(Statistics, {'period': query.period, 'account_id': query.account_id, 'items': buckets})
@@ -1,18 +1,44 @@
+import asyncio
+
 from sanic import Request, json
 from sanic.log import logger
 from sanic_ext.extensions.openapi import openapi
 
+from conf import settings
 from webapp import ErrorResponse, protected
 from webapp.api.account.router import bp_transaction
 from webapp.crud import transaction as crud_transaction
-from webapp.schema.account.transaction import TransactionCreate, TransactionRead
+from webapp.schema.account.transaction import (
+    TransactionBatchItem,
+    TransactionCreate,
+    TransactionExportQuery,
+    TransactionListQuery,
+    TransactionPage,
+    TransactionRead,
+)
+from webapp.utils import metrics
+from webapp.utils.idempotency import idempotency_filter
+from webapp.utils.serialization import dump_json, json_response
 from webapp.utils.signature import check_signature
 
 
+def _list_query(request: Request) -> TransactionListQuery:
+    return TransactionListQuery.model_validate({key: request.args.get(key) for key in request.args})
+
+
+def _page_limit(query: TransactionListQuery) -> int:
+    return min(query.limit or settings.TRANSACTION_PAGE_SIZE, settings.TRANSACTION_PAGE_SIZE_MAX)
+
+
 @bp_transaction.get('/my/<account_id:int>')
 @openapi.secured('token')
-@openapi.description('Get transactions by account ID')
-@openapi.response(status=200, content=TransactionRead, description='List of transactions for the specified account')
+@openapi.description('Get transactions by account ID, newest first')
+@openapi.parameter('limit', int, description='Page size')
+@openapi.parameter('cursor', str, description='Value of next_cursor from the previous page')
+@openapi.parameter('from', str, description='Lower timestamp bound (inclusive), ISO 8601')
+@openapi.parameter('to', str, description='Upper timestamp bound (exclusive), ISO 8601')
+@openapi.response(status=200, content=TransactionPage, description='Page of transactions for the specified account')
+@openapi.response(status=400, content=ErrorResponse, description='Invalid query parameters')
 @openapi.response(status=404, content=ErrorResponse, description='No transactions found for the specified account')
 @openapi.response(status=401, content=ErrorResponse, description='User not authenticated')
 @protected()
@@ -20,25 +46,32 @@ async def get_transactions_by_account(request: Request, account_id: int):
     logger.info('Received request to get transactions for account %d', account_id)
     user = request.ctx.user
 
-    async with request.ctx.session as session:
-        transactions = await crud_transaction.get_transactions_by_account_id(session, account_id, user['user_id'])
-        if not transactions:
-            logger.info('No transactions found for account %d', account_id)
-            return json({'error': 'No transactions found for this account'}, status=404)
+    try:
+        query = _list_query(request)
+        async with request.ctx.session as session:
+            transactions, next_cursor = await crud_transaction.get_transactions_by_account_id(
+                session, account_id, user['user_id'], _page_limit(query), query.cursor, query.date_from, query.date_to
+            )
+    except ValueError as e:
+        logger.warning('Invalid transactions query for account %d: %s', account_id, str(e))
+        return json({'error': str(e)}, status=400)
+    if not transactions:
+        logger.info('No transactions found for account %d', account_id)
+        return json({'error': 'No transactions found for this account'}, status=404)
 
     logger.info('Transactions retrieved for account %d', account_id)
-    return json(
-        [
-            TransactionRead.model_validate(transaction, from_attributes=True).model_dump(mode='json')
-            for transaction in transactions
-        ]
-    )
+    return json_response(TransactionPage, {'items': transactions, 'next_cursor': next_cursor})
 
 
 @bp_transaction.get('/my')
 @openapi.secured('token')
-@openapi.description('Get all transactions for the authenticated user')
-@openapi.response(status=200, content=TransactionRead, description='List of transactions for the authenticated user')
+@openapi.description('Get all transactions for the authenticated user, newest first')
+@openapi.parameter('limit', int, description='Page size')
+@openapi.parameter('cursor', str, description='Value of next_cursor from the previous page')
+@openapi.parameter('from', str, description='Lower timestamp bound (inclusive), ISO 8601')
+@openapi.parameter('to', str, description='Upper timestamp bound (exclusive), ISO 8601')
+@openapi.response(status=200, content=TransactionPage, description='Page of transactions for the authenticated user')
+@openapi.response(status=400, content=ErrorResponse, description='Invalid query parameters')
 @openapi.response(status=404, content=ErrorResponse, description='No transactions found for the user')
 @openapi.response(status=401, content=ErrorResponse, description='User not authenticated')
 @protected()
@@ -46,39 +79,178 @@ async def get_transactions(request: Request):
     user_id = request.ctx.user['user_id'] if request.ctx.user else 'unknown'
     logger.info('Received request to get transactions for user %d', user_id)
 
-    async with request.ctx.session as session:
-        transactions = await crud_transaction.get_transactions_by_user_id(session, request.ctx.user['user_id'])
-        if not transactions:
-            logger.info('No transactions found for user %d', request.ctx.user['user_id'])
-            return json({'error': 'No transactions found for this user'}, status=404)
+    try:
+        query = _list_query(request)
+        async with request.ctx.session as session:
+            transactions, next_cursor = await crud_transaction.get_transactions_by_user_id(
+                session, request.ctx.user['user_id'], _page_limit(query), query.cursor, query.date_from, query.date_to
+            )
+    except ValueError as e:
+        logger.warning('Invalid transactions query for user %d: %s', user_id, str(e))
+        return json({'error': str(e)}, status=400)
+    if not transactions:
+        logger.info('No transactions found for user %d', request.ctx.user['user_id'])
+        return json({'error': 'No transactions found for this user'}, status=404)
     logger.info('Transactions retrieved for user %d', request.ctx.user['user_id'])
-    return json(
-        [
-            TransactionRead.model_validate(transaction, from_attributes=True).model_dump(mode='json')
-            for transaction in transactions
-        ]
+    return json_response(TransactionPage, {'items': transactions, 'next_cursor': next_cursor})
+
+
+@bp_transaction.get('/my/export')
+@openapi.secured('token')
+@openapi.description('Stream the full statement of the authenticated user, oldest first')
+@openapi.parameter('format', str, description='csv (default) or ndjson')
+@openapi.parameter('account_id', int, description='Export only this account')
+@openapi.parameter('from', str, description='Lower timestamp bound (inclusive), ISO 8601')
+@openapi.parameter('to', str, description='Upper timestamp bound (exclusive), ISO 8601')
+@openapi.response(status=200, description='Statement rows as CSV or newline-delimited JSON')
+@openapi.response(status=400, content=ErrorResponse, description='Invalid query parameters')
+@openapi.response(status=401, content=ErrorResponse, description='User not authenticated')
+@protected()
+async def export_transactions(request: Request):
+    user_id = request.ctx.user['user_id']
+    logger.info('Received request to export transactions for user %d', user_id)
+
+    try:
+        query = TransactionExportQuery.model_validate({key: request.args.get(key) for key in request.args})
+    except ValueError as e:
+        logger.warning('Invalid export query for user %d: %s', user_id, str(e))
+        return json({'error': str(e)}, status=400)
+
+    response = await request.respond(
+        content_type='text/csv' if query.format == 'csv' else 'application/x-ndjson',
+        headers={'Content-Disposition': f'attachment; filename="statement_{user_id}.{query.format}"'},
     )
+    async with request.ctx.session as session:
+        if query.format == 'csv':
+            await crud_transaction.copy_transactions_csv(
+                session, response.send, user_id, query.account_id, query.date_from, query.date_to
+            )
+        else:
+            async for rows in crud_transaction.stream_transactions(
+                session, user_id, query.account_id, query.date_from, query.date_to
+            ):
+                await response.send(b''.join(dump_json(TransactionRead, row) + b'\n' for row in rows))
+    await response.eof()
+    logger.info('Transactions exported for user %d', user_id)
 
 
 @bp_transaction.post('/webhook/payment')
 @openapi.body(TransactionCreate)
 @openapi.description('Create a new transaction')
 @openapi.response(status=201, content=TransactionRead, description='Transaction created successfully')
+@openapi.response(status=202, description='Transaction accepted for background processing (write-behind mode)')
 @openapi.response(status=400, content=ErrorResponse, description='Invalid transaction data or signature')
+@openapi.response(status=503, content=ErrorResponse, description='Webhook queue is full (write-behind mode)')
 async def create_transaction(request: Request):
-    logger.info('Received transaction creation request: %s', request.json)
-
     transaction_data = request.json
+    # the payload itself only at DEBUG, the id is enough to follow an event at INFO
+    logger.info('Received transaction creation request: %s', transaction_data.get('transaction_id'))
+    logger.debug('Transaction payload: %r', transaction_data)
 
     if not check_signature(transaction_data):
         logger.error('Invalid signature for transaction data: %r', transaction_data)
+        metrics.webhook_events.inc('single', 'invalid_signature')
         return json({'error': 'Invalid signature'}, status=400)
 
+    # events accepted by the write-behind queue count until their commit settles them
+    pending = request.app.ctx.write_behind.pending if settings.WEBHOOK_WRITE_BEHIND else ()
+    if (
+        idempotency_filter.seen(transaction_data['transaction_id'])
+        or str(transaction_data['transaction_id']) in pending
+    ):
+        logger.info('Duplicate transaction answered from cache: %s', transaction_data['transaction_id'])
+        metrics.webhook_events.inc('single', 'duplicate')
+        return json({'error': 'Transaction with this ID already exists'}, status=400)
+
+    if settings.WEBHOOK_WRITE_BEHIND:
+        try:
+            TransactionCreate.model_validate(transaction_data)
+            await request.app.ctx.write_behind.put(transaction_data)
+        except ValueError as e:
+            logger.error('Invalid transaction data: %s', str(e))
+            metrics.webhook_events.inc('single', 'invalid')
+            return json({'error': str(e)}, status=400)
+        except asyncio.QueueFull:
+            logger.warning('Webhook queue is full, rejecting transaction %s', transaction_data['transaction_id'])
+            metrics.webhook_events.inc('single', 'busy')
+            return json({'error': 'Service is busy, retry later'}, status=503)
+        logger.info('Transaction accepted for processing: %s', transaction_data['transaction_id'])
+        metrics.webhook_events.inc('single', 'accepted')
+        return json({'transaction_id': str(transaction_data['transaction_id']), 'status': 'accepted'}, status=202)
+
     async with request.ctx.session as session:
         try:
             transaction = await crud_transaction.create_transaction(session, transaction_data)
+        except crud_transaction.DuplicateTransactionError as e:
+            idempotency_filter.add([transaction_data['transaction_id']])
+            logger.error('Transaction creation failed: %s', str(e))
+            metrics.webhook_events.inc('single', 'duplicate')
+            return json({'error': str(e)}, status=400)
         except ValueError as e:
             logger.error('Transaction creation failed: %s', str(e))
+            metrics.webhook_events.inc('single', 'failed')
             return json({'error': str(e)}, status=400)
+    idempotency_filter.add([transaction.transaction_id])
     logger.info('Transaction created successfully: %s', transaction.transaction_id)
-    return json(TransactionRead.model_validate(transaction, from_attributes=True).model_dump(mode='json'), status=201)
+    metrics.webhook_events.inc('single', 'created')
+    return json_response(TransactionRead, transaction, status=201)
+
+
+@bp_transaction.post('/webhook/payment/batch')
+@openapi.body(list[TransactionCreate])
+@openapi.description('Create transactions from a batch of payment events')
+@openapi.response(status=200, content=list[TransactionBatchItem], description='Status of every event, in input order')
+@openapi.response(status=400, content=ErrorResponse, description='Request body is not a list of events')
+async def create_transactions_batch(request: Request):
+    events = request.json
+    if not isinstance(events, list) or not events:
+        logger.error('Invalid transaction batch: expected a non-empty list')
+        return json({'error': 'Expected a non-empty list of events'}, status=400)
+    if len(events) > settings.WEBHOOK_BATCH_MAX_SIZE:
+        logger.error('Transaction batch too large: %d events', len(events))
+        return json({'error': f'Batch size exceeds {settings.WEBHOOK_BATCH_MAX_SIZE}'}, status=400)
+    logger.info('Received transaction batch of %d events', len(events))
+
+    results: list[TransactionBatchItem] = []
+    valid: list[dict] = []
+    seen: set[str] = set()
+    for event in events:
+        try:
+            TransactionCreate.model_validate(event)
+        except ValueError as e:
+            results.append(TransactionBatchItem(status='invalid', error=str(e)))
+            continue
+        transaction_id = str(event['transaction_id'])
+        if not check_signature(event):
+            results.append(TransactionBatchItem(transaction_id=transaction_id, status='invalid_signature'))
+        elif transaction_id in seen or idempotency_filter.seen(transaction_id):
+            results.append(TransactionBatchItem(transaction_id=transaction_id, status='duplicate'))
+        else:
+            seen.add(transaction_id)
+            valid.append(event)
+            results.append(TransactionBatchItem(transaction_id=transaction_id, status='created'))
+
+    if valid:
+        async with request.ctx.session as session:
+            created, rejected = await crud_transaction.create_transactions(session, valid)
+        created_ids = {transaction.transaction_id for transaction in created}
+        confirmed = set(created_ids)
+        for item in results:
+            if item.status != 'created':
+                continue
+            if item.transaction_id in rejected:
+                item.status, item.error = 'rejected', rejected[item.transaction_id]
+            elif item.transaction_id not in created_ids:
+                item.status = 'duplicate'
+                confirmed.add(item.transaction_id)
+        # only ids the database stored, a repeat of a rejected event in the batch must not block its retries
+        idempotency_filter.add(confirmed)
+    for item in results:
+        metrics.webhook_events.inc('batch', item.status)
+
+    logger.info(
+        'Transaction batch processed: %d events, %d created',
+        len(events),
+        sum(item.status == 'created' for item in results),
+    )
+    return json_response(TransactionBatchItem, results, many=True)
@@ -5,10 +5,11 @@ from sanic_ext.extensions.openapi import openapi
 
 from webapp import ErrorResponse
 from webapp.api.login.router import bp_auth
-from webapp.crud.user import get_user_by_email
+from webapp.crud.user import get_user_by_email, update_password_hash
 from webapp.schema.login.auth import LoginRequest, LoginResponse
 from webapp.utils.auth.jwt import jwt_auth
-from webapp.utils.auth.password import verify_password
+from webapp.utils.auth.password import hash_password, needs_rehash, verify_password
+from webapp.utils.profiling import timed
 
 
 @bp_auth.post('/login')
@@ -30,10 +31,17 @@ async def login(request: Request):
         if not user:
             logger.warning('Login failed: user not found (%s)', data.email)
             return json({'error': 'Invalid email or password'}, status=401)
-        if not verify_password(data.password, user.hashed_password):
+        with timed('auth'):
+            verified = await verify_password(data.password, user.hashed_password)
+        if not verified:
             logger.warning('Login failed: invalid password for %s', data.email)
             return json({'error': 'Invalid email or password'}, status=401)
+        if needs_rehash(user.hashed_password):
+            # the plain password is only available here, so cost changes are applied on login
+            await update_password_hash(session, user, await hash_password(data.password))
+            logger.info('Password hash of %s upgraded to the configured cost', data.email)
 
-        token = jwt_auth.create_token(user.user_id, user.role)
+        with timed('auth'):
+            token = jwt_auth.create_token(user.user_id, user.role)
         logger.info('User %s logged in successfully', data.email)
         return json(LoginResponse(access_token=token).model_dump())
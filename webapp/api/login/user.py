@@ -3,10 +3,21 @@ from sanic.log import logger
 from sanic.response import HTTPResponse, json
 from sanic_ext.extensions.openapi import openapi
 
+from conf import settings
 from webapp import ErrorResponse, protected
 from webapp.api.login.router import bp_user
 from webapp.crud import user as crud_user
-from webapp.schema.login.user import UserCreate, UserRead, UserUpdate
+from webapp.crud.loading import LoadProfile
+from webapp.schema.login.user import (
+    UserCreate,
+    UserListQuery,
+    UserPage,
+    UserRead,
+    UserShort,
+    UserUpdate,
+    UserWithAccounts,
+)
+from webapp.utils.serialization import json_response
 
 
 @bp_user.post('/')
@@ -29,7 +40,7 @@ async def create_user(request: Request):
         async with request.ctx.session as session:
             db_user = await crud_user.create_user(session, user_in)
         logger.info('User %s created new user %s', user.get('user_id'), db_user.user_id)
-        return json(UserRead.model_validate(db_user, from_attributes=True).model_dump(mode='json'), status=201)
+        return json_response(UserRead, db_user, status=201)
     except ValueError as e:
         logger.error('ValueError while creating user by %s: %s', user.get('user_id'), str(e))
         return json({'error': str(e)}, status=400)
@@ -38,10 +49,24 @@ async def create_user(request: Request):
         return json({'error': 'Internal Server Error'}, status=500)
 
 
+# embed= -> what is loaded for each user on the page and the schema it is returned as
+EMBEDS = {
+    None: (LoadProfile.SUMMARY, UserShort),
+    'accounts': (LoadProfile.ACCOUNTS, UserWithAccounts),
+    'transactions': (LoadProfile.DETAIL, UserRead),
+}
+
+
 @bp_user.get('/')
 @openapi.secured('token')
-@openapi.description('List all users')
-@openapi.response(status=200, content=UserRead, description='List of users')
+@openapi.description('List users, ordered by ID')
+@openapi.parameter('limit', int, description='Page size')
+@openapi.parameter('cursor', str, description='Value of next_cursor from the previous page')
+@openapi.parameter('role', str, description='Only users with this role')
+@openapi.parameter('email', str, description='Only users whose email starts with this prefix')
+@openapi.parameter('embed', str, description='accounts or transactions (accounts with their transactions)')
+@openapi.response(status=200, content=UserPage[UserShort], description='Page of users')
+@openapi.response(status=400, content=ErrorResponse, description='Invalid query parameters')
 @openapi.response(status=401, content=ErrorResponse, description='User not authenticated')
 @openapi.response(status=403, content=ErrorResponse, description='Access denied. Only admin user')
 @protected()
@@ -51,10 +76,23 @@ async def list_users(request: Request):
     if user['role'] != 'admin':
         logger.warning('Access denied for user %s: not admin', user.get('user_id'))
         return json({'error': 'Access denied. Only admin user'}, status=403)
-    async with request.ctx.session as session:
-        users = await crud_user.get_all_users(session)
-        logger.info('User %s listed all users', user.get('user_id'))
-        return json([UserRead.model_validate(user, from_attributes=True).model_dump(mode='json') for user in users])
+    try:
+        query = UserListQuery.model_validate({key: request.args.get(key) for key in request.args})
+        profile, schema = EMBEDS[query.embed]
+        async with request.ctx.session as session:
+            users, next_cursor = await crud_user.get_users_page(
+                session,
+                min(query.limit or settings.USER_PAGE_SIZE, settings.USER_PAGE_SIZE_MAX),
+                query.cursor,
+                query.role,
+                query.email,
+                profile,
+            )
+    except ValueError as e:
+        logger.warning('Invalid user list query from %s: %s', user.get('user_id'), str(e))
+        return json({'error': str(e)}, status=400)
+    logger.info('User %s listed %d users', user.get('user_id'), len(users))
+    return json_response(UserPage[schema], {'items': users, 'next_cursor': next_cursor})
 
 
 @bp_user.delete('/<user_id:int>')
@@ -95,12 +133,12 @@ async def get_user(request: Request, user_id: int):
         logger.warning('Access denied for user %d: not admin', user.get('user_id'))
         return json({'error': 'Access denied. Only admin user'}, status=403)
     async with request.ctx.session as session:
-        user_db = await crud_user.get_user_by_id(session, user_id)
+        user_db = await crud_user.get_cached_user(session, user_id)
         if not user_db:
             logger.warning('User %d not found (requested by %d)', user_id, user.get('user_id'))
             return json({'error': 'User not found'}, status=404)
     logger.info('User %d retrieved info for user %d', user.get('user_id'), user_id)
-    return json(UserRead.model_validate(user_db, from_attributes=True).model_dump(mode='json'))
+    return json_response(UserRead, user_db)
 
 
 @bp_user.patch('/update/<user_id:int>')
@@ -129,7 +167,7 @@ async def update_user(request: Request, user_id: int):
             logger.error('ValueError while updating user %d by %d: %s', user_id, user.get('user_id'), str(e))
             return json({'error': str(e)}, status=400)
         logger.info('User %d updated user %d', user.get('user_id'), user_id)
-        return json(UserRead.model_validate(user_db, from_attributes=True).model_dump(mode='json'))
+        return json_response(UserRead, user_db)
 
 
 @bp_user.patch('/me/update')
@@ -155,7 +193,7 @@ async def update_me(request: Request):
             logger.error('ValueError while updating self (%d): %s', user.get('user_id'), str(e))
             return json({'error': str(e)}, status=400)
         logger.info('User %d updated own profile', user.get('user_id'))
-        return json(UserRead.model_validate(user_db, from_attributes=True).model_dump(mode='json'))
+        return json_response(UserRead, user_db)
 
 
 @bp_user.get('/me')
@@ -170,9 +208,9 @@ async def me(request: Request):
     logger.info('User %d requests own profile', user.get('user_id'))
 
     async with request.ctx.session as session:
-        user_db = await crud_user.get_user_by_id(session, user['user_id'])
+        user_db = await crud_user.get_cached_user(session, user['user_id'])
         if not user_db:
             logger.warning('User %d not found for /me', user.get('user_id'))
             return json({'error': 'User not found'}, status=404)
         logger.info('User %d retrieved own profile', user.get('user_id'))
-        return json(UserRead.model_validate(user_db, from_attributes=True).model_dump(mode='json'))
+        return json_response(UserRead, user_db)
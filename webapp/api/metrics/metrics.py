@@ -0,0 +1,10 @@
+from sanic import Request, text
+from sanic_ext.extensions.openapi import openapi
+
+from webapp.api.metrics.router import bp_metrics
+
+
+@bp_metrics.get('/metrics')
+@openapi.exclude()
+async def get_metrics(request: Request):
+    return text(request.app.ctx.metrics.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
@@ -0,0 +1,3 @@
+from sanic import Blueprint
+
+bp_metrics = Blueprint('metrics')
@@ -1,32 +1,57 @@
 from typing import List
 
-from sqlalchemy import select
+from sqlalchemy import Row, select
 from sqlalchemy.exc import IntegrityError
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import selectinload
 
+from webapp.crud import cache
+from webapp.crud.loading import LoadProfile
 from webapp.models.billing.account import Account
-from webapp.schema.account.account import AccountUpdate
+from webapp.schema.account.account import AccountRead, AccountsReadShort, AccountUpdate
+from webapp.utils.serialization import to_schema
 
 
-async def get_accounts_by_user_id(session: AsyncSession, user_id: int) -> List[Account]:
+async def get_accounts_by_user_id(
+    session: AsyncSession, user_id: int, profile: LoadProfile = LoadProfile.SUMMARY
+) -> List[Account] | List[Row]:
+    if profile is LoadProfile.SUMMARY:
+        stmt = select(Account.account_id, Account.account_name, Account.balance).where(Account.user_id == user_id)
+        result = await session.execute(stmt)
+        return result.all()
+
     stmt = select(Account).options(selectinload(Account.transactions)).where(Account.user_id == user_id)
     result = await session.execute(stmt)
     return result.scalars().all()
 
 
-async def get_account_by_id(session: AsyncSession, account_id: int, user_id) -> Account | None:
-    stmt = (
-        select(Account)
-        .options(selectinload(Account.transactions))
-        .where(Account.account_id == account_id and Account.user_id == user_id)
-    )
+async def get_account_by_id(
+    session: AsyncSession, account_id: int, user_id: int, profile: LoadProfile = LoadProfile.DETAIL
+) -> Account | None:
+    stmt = select(Account).where(Account.account_id == account_id, Account.user_id == user_id)
+    if profile is LoadProfile.DETAIL:
+        stmt = stmt.options(selectinload(Account.transactions))
     result = await session.execute(stmt)
     return result.scalar_one_or_none()
 
 
+async def get_cached_accounts(session: AsyncSession, user_id: int) -> List[AccountsReadShort]:
+    async def load() -> List[AccountsReadShort]:
+        return to_schema(AccountsReadShort, await get_accounts_by_user_id(session, user_id), many=True)
+
+    return await cache.read_through(cache.user_namespace(user_id), 'accounts', load)
+
+
+async def get_cached_account(session: AsyncSession, account_id: int, user_id: int) -> AccountRead | None:
+    async def load() -> AccountRead | None:
+        account = await get_account_by_id(session, account_id, user_id, LoadProfile.DETAIL)
+        return to_schema(AccountRead, account) if account else None
+
+    return await cache.read_through(cache.user_namespace(user_id), ('account', account_id), load)
+
+
 async def update_account(session: AsyncSession, account_id: int, account_data: AccountUpdate, user_id: int) -> Account:
-    account = await get_account_by_id(session, account_id, user_id)
+    account = await get_account_by_id(session, account_id, user_id, LoadProfile.SUMMARY)
     if not account:
         raise ValueError('Account not found or does not belong to the user')
 
@@ -35,12 +60,12 @@ async def update_account(session: AsyncSession, account_id: int, account_data: A
 
     try:
         await session.commit()
-        await session.refresh(account)
     except IntegrityError as e:
         await session.rollback()
         err_msg = str(e.orig)
         if 'uq_account_account_name' in err_msg:
             raise ValueError('Account with this name already exists for the user')
         raise ValueError(f'Error updating account: {str(e)}')
+    await cache.invalidate_users(user_id)
 
-    return account
+    return await get_account_by_id(session, account_id, user_id, LoadProfile.DETAIL)
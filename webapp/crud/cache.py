@@ -0,0 +1,111 @@
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Hashable, Protocol, Set, Tuple
+
+from conf import settings
+from webapp.utils import metrics
+
+
+class CacheStore(Protocol):
+    async def get(self, namespace: Hashable, key: Hashable) -> Any:
+        '''Cached value or None.'''
+
+    async def set(self, namespace: Hashable, key: Hashable, value: Any, generation: int) -> None:
+        '''Stores value unless the namespace was invalidated after generation was read.'''
+
+    async def generation(self, namespace: Hashable) -> int:
+        '''Token to pass to set after loading the value.'''
+
+    async def invalidate(self, namespace: Hashable) -> None:
+        '''Drops the cached values of namespace and refuses sets of loads that started before.'''
+
+
+class MemoryCacheStore:
+    # Per-process TTL + LRU store. Invalidation only reaches the current worker, with several
+    # workers the TTL bounds how stale the others can be until a shared store is plugged in.
+    def __init__(self, max_size: int, ttl: float) -> None:
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries: OrderedDict[Tuple[Hashable, Hashable], Tuple[float, Any]] = OrderedDict()
+        self._keys: Dict[Hashable, Set[Hashable]] = {}
+        # generations are ticks of one store-wide clock; the last invalidation of at most max_size
+        # namespaces is kept, one that dropped out counts as invalidated at the newest dropped tick,
+        # so a load that started before it can still not store stale data
+        self._clock = 0
+        self._invalidated: OrderedDict[Hashable, int] = OrderedDict()
+        self._floor = 0
+
+    async def get(self, namespace: Hashable, key: Hashable) -> Any:
+        entry = self._entries.get((namespace, key))
+        if entry is None:
+            return None
+        expires_at, value = entry
+        if expires_at < time.monotonic():
+            self._evict((namespace, key))
+            return None
+        self._entries.move_to_end((namespace, key))
+        return value
+
+    async def set(self, namespace: Hashable, key: Hashable, value: Any, generation: int) -> None:
+        if self._invalidated.get(namespace, self._floor) > generation:
+            return
+        self._entries[(namespace, key)] = (time.monotonic() + self.ttl, value)
+        self._entries.move_to_end((namespace, key))
+        self._keys.setdefault(namespace, set()).add(key)
+        while len(self._entries) > self.max_size:
+            self._evict(next(iter(self._entries)))
+
+    async def generation(self, namespace: Hashable) -> int:
+        return self._clock
+
+    async def invalidate(self, namespace: Hashable) -> None:
+        self._clock += 1
+        self._invalidated[namespace] = self._clock
+        self._invalidated.move_to_end(namespace)
+        while len(self._invalidated) > self.max_size:
+            _, self._floor = self._invalidated.popitem(last=False)
+        for key in self._keys.pop(namespace, ()):
+            self._entries.pop((namespace, key), None)
+
+    def _evict(self, entry_key: Tuple[Hashable, Hashable]) -> None:
+        del self._entries[entry_key]
+        namespace, key = entry_key
+        keys = self._keys.get(namespace)
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._keys[namespace]
+
+
+store: CacheStore = MemoryCacheStore(settings.CACHE_MAX_SIZE, settings.CACHE_TTL)
+
+
+def use_store(cache_store: CacheStore) -> None:
+    global store
+    store = cache_store
+
+
+def user_namespace(user_id: int) -> str:
+    # everything cached for a user goes stale together when any of the user's data changes
+    return f'user:{user_id}'
+
+
+async def read_through(namespace: Hashable, key: Hashable, loader: Callable[[], Awaitable[Any]]) -> Any:
+    if not settings.CACHE_ENABLED:
+        return await loader()
+    value = await store.get(namespace, key)
+    if value is not None:
+        metrics.cache_requests.inc('hit')
+        return value
+    metrics.cache_requests.inc('miss')
+    generation = await store.generation(namespace)
+    value = await loader()
+    if value is not None:
+        await store.set(namespace, key, value, generation)
+    return value
+
+
+async def invalidate_users(*user_ids: int) -> None:
+    if settings.CACHE_ENABLED:
+        for user_id in set(user_ids):
+            await store.invalidate(user_namespace(user_id))
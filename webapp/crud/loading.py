@@ -0,0 +1,10 @@
+from enum import Enum
+
+
+class LoadProfile(str, Enum):
+    # only the columns the short views return, no relationships
+    SUMMARY = 'summary'
+    # the user's accounts without their transactions
+    ACCOUNTS = 'accounts'
+    # the object graph the *Read schemas serialize
+    DETAIL = 'detail'
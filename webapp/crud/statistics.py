@@ -0,0 +1,52 @@
+from datetime import date
+from typing import List, Optional
+
+from sqlalchemy import Date, Row, cast, delete, func, insert, select, text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from webapp.models.billing.account_rollup import AccountRollup
+from webapp.models.billing.transaction import Transaction
+
+
+async def get_statistics(
+    session: AsyncSession,
+    user_id: int,
+    period: str = 'day',
+    date_from: Optional[date] = None,
+    date_to: Optional[date] = None,
+    account_id: Optional[int] = None,
+) -> List[Row]:
+    # reads the daily rollups only: O(buckets), however many transactions they summarize
+    if period == 'month':
+        period_start = cast(func.date_trunc('month', AccountRollup.bucket), Date)
+    else:
+        period_start = AccountRollup.bucket
+    stmt = select(
+        period_start.label('bucket'),
+        func.sum(AccountRollup.total).label('total'),
+        func.sum(AccountRollup.count).label('count'),
+    ).where(AccountRollup.user_id == user_id)
+    if account_id is not None:
+        stmt = stmt.where(AccountRollup.account_id == account_id)
+    if date_from is not None:
+        stmt = stmt.where(AccountRollup.bucket >= date_from)
+    if date_to is not None:
+        stmt = stmt.where(AccountRollup.bucket < date_to)
+    stmt = stmt.group_by(period_start).order_by(period_start)
+    result = await session.execute(stmt)
+    return result.all()
+
+
+async def rebuild_rollups(session: AsyncSession) -> int:
+    # SHARE mode blocks ingestion (but not reads) until the commit, so no insert is counted twice or missed
+    await session.execute(text(f'LOCK TABLE {Transaction.__table__.fullname} IN SHARE MODE'))
+    await session.execute(delete(AccountRollup))
+    bucket = cast(Transaction.timestamp, Date)
+    daily = select(
+        Transaction.account_id, bucket, Transaction.user_id, func.sum(Transaction.amount), func.count()
+    ).group_by(Transaction.account_id, bucket, Transaction.user_id)
+    result = await session.execute(
+        insert(AccountRollup).from_select(['account_id', 'bucket', 'user_id', 'total', 'count'], daily)
+    )
+    await session.commit()
+    return result.rowcount
@@ -1,55 +1,298 @@
-from typing import List
+from datetime import datetime
+from typing import AsyncIterator, Awaitable, Callable, Dict, List, Optional, Sequence, Set, Tuple
 
-from sqlalchemy import select
-from sqlalchemy.exc import IntegrityError
+from sqlalchemy import CTE, Date, Row, Select, cast, column, func, select, tuple_, values
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.exc import DataError, IntegrityError
 from sqlalchemy.ext.asyncio import AsyncSession
 
+from conf import settings
+from webapp.crud import cache
 from webapp.models.billing.account import Account
+from webapp.models.billing.account_rollup import AccountRollup
 from webapp.models.billing.transaction import Transaction
+from webapp.models.billing.transaction_key import TransactionKey
+from webapp.utils.pagination import cursor_id, cursor_timestamp, decode_cursor, encode_cursor
 
 
-async def get_transactions_by_user_id(session: AsyncSession, user_id: int) -> List[Transaction]:
-    stmt = select(Transaction).where(Transaction.user_id == user_id)
-    result = await session.execute(stmt)
-    return result.scalars().all()
+class DuplicateTransactionError(ValueError):
+    pass
+
 
+def _paginate(
+    stmt: Select,
+    limit: int,
+    cursor: Optional[str],
+    date_from: Optional[datetime],
+    date_to: Optional[datetime],
+) -> Select:
+    if date_from is not None:
+        stmt = stmt.where(Transaction.timestamp >= date_from)
+    if date_to is not None:
+        stmt = stmt.where(Transaction.timestamp < date_to)
+    if cursor:
+        try:
+            timestamp, last_id = decode_cursor(cursor)
+            timestamp, last_id = cursor_timestamp(timestamp), cursor_id(last_id)
+        except (TypeError, ValueError):
+            raise ValueError('Invalid cursor')
+        # the plain bound is redundant for the row comparison but lets Postgres prune newer partitions
+        stmt = stmt.where(
+            Transaction.timestamp <= timestamp,
+            tuple_(Transaction.timestamp, Transaction.id) < tuple_(timestamp, last_id),
+        )
+    # one extra row tells whether there is a next page
+    return stmt.order_by(Transaction.timestamp.desc(), Transaction.id.desc()).limit(limit + 1)
 
-async def get_transactions_by_account_id(session: AsyncSession, account_id: int, user_id: int) -> List[Transaction]:
-    stmt = select(Transaction).where(Transaction.account_id == account_id and Transaction.user_id == user_id)
+
+async def _fetch_page(session: AsyncSession, stmt: Select, limit: int) -> Tuple[List[Transaction], Optional[str]]:
     result = await session.execute(stmt)
-    return result.scalars().all()
+    transactions = result.scalars().all()
+    if len(transactions) <= limit:
+        return transactions, None
+    transactions = transactions[:limit]
+    return transactions, encode_cursor(transactions[-1].timestamp, transactions[-1].id)
 
 
-async def create_transaction(session: AsyncSession, transaction_data: dict) -> Transaction:
-    stmt = select(Account).where(
-        Account.account_id == transaction_data['account_id'], Account.user_id == transaction_data['user_id']
+async def get_transactions_by_user_id(
+    session: AsyncSession,
+    user_id: int,
+    limit: int,
+    cursor: Optional[str] = None,
+    date_from: Optional[datetime] = None,
+    date_to: Optional[datetime] = None,
+) -> Tuple[List[Transaction], Optional[str]]:
+    stmt = _paginate(select(Transaction).where(Transaction.user_id == user_id), limit, cursor, date_from, date_to)
+    return await _fetch_page(session, stmt, limit)
+
+
+async def get_transactions_by_account_id(
+    session: AsyncSession,
+    account_id: int,
+    user_id: int,
+    limit: int,
+    cursor: Optional[str] = None,
+    date_from: Optional[datetime] = None,
+    date_to: Optional[datetime] = None,
+) -> Tuple[List[Transaction], Optional[str]]:
+    stmt = select(Transaction).where(Transaction.account_id == account_id, Transaction.user_id == user_id)
+    stmt = _paginate(stmt, limit, cursor, date_from, date_to)
+    return await _fetch_page(session, stmt, limit)
+
+
+def _export_stmt(
+    user_id: int,
+    account_id: Optional[int],
+    date_from: Optional[datetime],
+    date_to: Optional[datetime],
+) -> Select:
+    stmt = select(
+        Transaction.id,
+        Transaction.transaction_id,
+        Transaction.account_id,
+        Transaction.user_id,
+        Transaction.amount,
+        Transaction.timestamp,
+        Transaction.signature,
+    ).where(Transaction.user_id == user_id)
+    if account_id is not None:
+        stmt = stmt.where(Transaction.account_id == account_id)
+    if date_from is not None:
+        stmt = stmt.where(Transaction.timestamp >= date_from)
+    if date_to is not None:
+        stmt = stmt.where(Transaction.timestamp < date_to)
+    return stmt.order_by(Transaction.timestamp, Transaction.id)
+
+
+async def stream_transactions(
+    session: AsyncSession,
+    user_id: int,
+    account_id: Optional[int] = None,
+    date_from: Optional[datetime] = None,
+    date_to: Optional[datetime] = None,
+) -> AsyncIterator[Sequence[Row]]:
+    stmt = _export_stmt(user_id, account_id, date_from, date_to)
+    result = await session.stream(stmt.execution_options(yield_per=settings.TRANSACTION_EXPORT_FETCH_SIZE))
+    async for rows in result.partitions():
+        yield rows
+
+
+async def copy_transactions_csv(
+    session: AsyncSession,
+    output: Callable[[bytes], Awaitable],
+    user_id: int,
+    account_id: Optional[int] = None,
+    date_from: Optional[datetime] = None,
+    date_to: Optional[datetime] = None,
+) -> None:
+    connection = await session.connection()
+    compiled = _export_stmt(user_id, account_id, date_from, date_to).compile(dialect=connection.dialect)
+    raw_connection = await connection.get_raw_connection()
+    # COPY hands every chunk to output as soon as the server produces it
+    await raw_connection.driver_connection.copy_from_query(
+        str(compiled),
+        *(compiled.params[name] for name in compiled.positiontup),
+        output=output,
+        format='csv',
+        header=True,
     )
-    result = await session.execute(stmt)
-    account = result.scalar_one_or_none()
-
-    if account is None:
-        account = Account(account_id=transaction_data['account_id'], user_id=transaction_data['user_id'], balance=0)
-        session.add(account)
-        await session.flush()
-
-    transaction = Transaction(
-        transaction_id=transaction_data['transaction_id'],
-        account_id=transaction_data['account_id'],
-        user_id=transaction_data['user_id'],
-        amount=transaction_data['amount'],
-        signature=transaction_data['signature'],
+
+
+def _insert_registered(rows: List[dict]) -> CTE:
+    # the partitioned table has no unique index on transaction_id alone, the registry insert is the duplicate gate
+    registered = (
+        pg_insert(TransactionKey)
+        .values([{'transaction_id': row['transaction_id'], 'user_id': row['user_id']} for row in rows])
+        .on_conflict_do_nothing(index_elements=[TransactionKey.transaction_id])
+        .returning(TransactionKey.transaction_id)
+        .cte('registered_transaction')
+    )
+    keys = [key for key in Transaction.__table__.c.keys() if key != 'id']
+    incoming = values(*(column(key, Transaction.__table__.c[key].type) for key in keys), name='incoming').data(
+        [tuple(row[key] for key in keys) for row in rows]
     )
-    try:
-        session.add(transaction)
-
-        # Add transaction amount to account balance
-        account.balance += transaction_data['amount']
-
-        await session.commit()
-        await session.refresh(transaction)
-    except IntegrityError as e:
-        await session.rollback()
-        err_msg = str(e.orig)
-        if 'uq_transaction_transaction_id' in err_msg:
-            raise ValueError('Transaction with this ID already exists')
-    return transaction
+    return (
+        pg_insert(Transaction)
+        .from_select(
+            keys,
+            select(incoming).where(incoming.c.transaction_id.in_(select(registered.c.transaction_id))),
+        )
+        .returning(*Transaction.__table__.c)
+        .cte('inserted_transaction')
+    )
+
+
+def _ingest_stmt(transactions: List[dict], timestamp: datetime) -> Select:
+    # A single statement: the transaction insert is the duplicate gate, and only newly inserted
+    # rows are folded into the balances and the daily rollups, one grouped atomic upsert per
+    # account (and day), so concurrent webhooks can't lose updates.
+    rows = [
+        {
+            'transaction_id': str(transaction_data['transaction_id']),
+            'account_id': transaction_data['account_id'],
+            'user_id': transaction_data['user_id'],
+            'amount': transaction_data['amount'],
+            'timestamp': timestamp,
+            'signature': transaction_data['signature'],
+        }
+        for transaction_data in transactions
+    ]
+    if settings.TRANSACTION_PARTITIONING:
+        inserted = _insert_registered(rows)
+    else:
+        inserted = (
+            pg_insert(Transaction)
+            .values(rows)
+            .on_conflict_do_nothing(index_elements=[Transaction.transaction_id])
+            .returning(*Transaction.__table__.c)
+            .cte('inserted_transaction')
+        )
+    account_insert = pg_insert(Account).from_select(
+        [Account.account_id, Account.user_id, Account.balance, Account.account_date],
+        select(
+            inserted.c.account_id, inserted.c.user_id, func.sum(inserted.c.amount), func.min(inserted.c.timestamp)
+        ).group_by(inserted.c.account_id, inserted.c.user_id),
+    )
+    updated = (
+        account_insert.on_conflict_do_update(
+            index_elements=[Account.account_id],
+            set_={'balance': Account.balance + account_insert.excluded.balance},
+            where=Account.user_id == account_insert.excluded.user_id,
+        )
+        .returning(Account.account_id)
+        .cte('updated_account')
+    )
+    bucket = cast(inserted.c.timestamp, Date)
+    daily = select(
+        inserted.c.account_id, bucket, inserted.c.user_id, func.sum(inserted.c.amount), func.count()
+    ).group_by(inserted.c.account_id, bucket, inserted.c.user_id)
+    rollup_insert = pg_insert(AccountRollup).from_select(['account_id', 'bucket', 'user_id', 'total', 'count'], daily)
+    updated_rollup = rollup_insert.on_conflict_do_update(
+        index_elements=[AccountRollup.account_id, AccountRollup.bucket],
+        set_={
+            'total': AccountRollup.total + rollup_insert.excluded.total,
+            'count': AccountRollup.count + rollup_insert.excluded.count,
+        },
+    ).cte('updated_rollup')
+    return (
+        select(inserted, updated.c.account_id.label('updated_account_id'))
+        .outerjoin(updated, updated.c.account_id == inserted.c.account_id)
+        .add_cte(updated_rollup)
+    )
+
+
+async def create_transactions(
+    session: AsyncSession, transactions: List[dict]
+) -> Tuple[List[Transaction], Dict[str, str]]:
+    # Returns the created transactions and the rejected ids with the reason, either the account
+    # belongs to another user or the database refused the event; any other submitted id was a duplicate.
+    rejected: Dict[str, str] = {}
+    seen: Set[str] = set()
+    # the grouped upsert may touch each account only once per statement: an event that names another
+    # user for an account already in a group goes into a follow-up statement, and the account row in
+    # the database decides which of them is the owner
+    groups: List[Tuple[Dict[int, int], List[dict]]] = []
+    for transaction_data in transactions:
+        transaction_id = str(transaction_data['transaction_id'])
+        if transaction_id in seen:
+            continue
+        seen.add(transaction_id)
+        account_id, user_id = transaction_data['account_id'], transaction_data['user_id']
+        for owners, group in groups:
+            if owners.setdefault(account_id, user_id) == user_id:
+                group.append(transaction_data)
+                break
+        else:
+            groups.append(({account_id: user_id}, [transaction_data]))
+
+    statements = [group for _, group in groups]
+    rows = []
+    while statements:
+        group = statements.pop(0)
+        # a statement runs after rows of the earlier ones, a savepoint keeps them when it is undone
+        savepoint = await session.begin_nested() if rows else None
+        try:
+            result = await session.execute(_ingest_stmt(group, datetime.now()))
+            group_rows = result.all()
+        except (IntegrityError, DataError) as e:
+            await (savepoint.rollback() if savepoint is not None else session.rollback())
+            if len(group) == 1:
+                rejected[str(group[0]['transaction_id'])] = f'Error creating transaction: {str(e.orig)}'
+            else:
+                # e.g. an unknown user: the violation fails the whole statement, retry its events one at a time
+                statements[:0] = [[transaction_data] for transaction_data in group]
+            continue
+
+        foreign = {row.transaction_id for row in group_rows if row.updated_account_id is None}
+        if not foreign:
+            if savepoint is not None:
+                await savepoint.commit()
+            rows += group_rows
+            continue
+        # rare path: undo the statement and retry without the foreign-account rows
+        await (savepoint.rollback() if savepoint is not None else session.rollback())
+        rejected.update(dict.fromkeys(foreign, 'Account does not belong to the user'))
+        group = [t for t in group if str(t['transaction_id']) not in foreign]
+        if group:
+            statements.insert(0, group)
+
+    await session.commit()
+    await cache.invalidate_users(*(row.user_id for row in rows))
+    return [
+        Transaction(**{column.key: getattr(row, column.key) for column in Transaction.__table__.c}) for row in rows
+    ], rejected
+
+
+async def create_transaction(session: AsyncSession, transaction_data: dict) -> Transaction:
+    created, rejected = await create_transactions(session, [transaction_data])
+    if rejected:
+        raise ValueError(rejected[str(transaction_data['transaction_id'])])
+    if not created:
+        raise DuplicateTransactionError('Transaction with this ID already exists')
+    return created[0]
+
+
+async def get_recent_transaction_ids(session: AsyncSession, limit: int) -> List[str]:
+    stmt = select(Transaction.transaction_id).order_by(Transaction.id.desc()).limit(limit)
+    result = await session.execute(stmt)
+    return result.scalars().all()
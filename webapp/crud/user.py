@@ -1,31 +1,47 @@
-from typing import List, Optional
+from typing import List, Optional, Tuple
 
-from sqlalchemy import select
+from sqlalchemy import Row, Select, select
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import selectinload
 
+from webapp.crud import cache
+from webapp.crud.loading import LoadProfile
 from webapp.models.billing.account import Account
 from webapp.models.billing.user import User
-from webapp.schema.login.user import UserCreate, UserUpdate
+from webapp.schema.login.user import UserCreate, UserRead, UserUpdate
 from webapp.utils.auth.password import hash_password
+from webapp.utils.pagination import cursor_id, decode_cursor, encode_cursor
+from webapp.utils.serialization import to_schema
 
 
-async def get_user_by_id(session: AsyncSession, user_id: int) -> Optional[User]:
-    stmt = (
-        select(User)
-        .options(selectinload(User.accounts).selectinload(Account.transactions))
-        .where(User.user_id == user_id)
-    )
+def _with_profile(stmt: Select, profile: LoadProfile) -> Select:
+    if profile is LoadProfile.DETAIL:
+        stmt = stmt.options(selectinload(User.accounts).selectinload(Account.transactions))
+    elif profile is LoadProfile.ACCOUNTS:
+        stmt = stmt.options(selectinload(User.accounts))
+    return stmt
+
+
+async def get_user_by_id(
+    session: AsyncSession, user_id: int, profile: LoadProfile = LoadProfile.DETAIL
+) -> Optional[User]:
+    stmt = _with_profile(select(User).where(User.user_id == user_id), profile)
     result = await session.execute(stmt)
     return result.scalar_one_or_none()
 
 
-async def get_user_by_username(session: AsyncSession, username: str) -> Optional[User]:
-    stmt = (
-        select(User)
-        .options(selectinload(User.accounts).selectinload(Account.transactions))
-        .where(User.username == username)
-    )
+async def get_cached_user(session: AsyncSession, user_id: int) -> Optional[UserRead]:
+    async def load() -> Optional[UserRead]:
+        user = await get_user_by_id(session, user_id, LoadProfile.DETAIL)
+        return to_schema(UserRead, user) if user else None
+
+    return await cache.read_through(cache.user_namespace(user_id), 'profile', load)
+
+
+async def get_user_by_username(
+    session: AsyncSession, username: str, profile: LoadProfile = LoadProfile.DETAIL
+) -> Optional[User]:
+    stmt = _with_profile(select(User).where(User.username == username), profile)
     result = await session.execute(stmt)
     return result.scalar_one_or_none()
 
@@ -35,10 +51,41 @@ async def get_user_by_email(session: AsyncSession, email: str) -> User | None:
     return result.scalar_one_or_none()
 
 
-async def get_all_users(session: AsyncSession) -> List[User]:
-    stmt = select(User).options(selectinload(User.accounts).selectinload(Account.transactions))
-    result = await session.execute(stmt)
-    return result.scalars().all()
+async def update_password_hash(session: AsyncSession, user: User, hashed_password: str) -> None:
+    user.hashed_password = hashed_password
+    await session.commit()
+
+
+async def get_users_page(
+    session: AsyncSession,
+    limit: int,
+    cursor: Optional[str] = None,
+    role: Optional[str] = None,
+    email_prefix: Optional[str] = None,
+    profile: LoadProfile = LoadProfile.SUMMARY,
+) -> Tuple[List[User] | List[Row], Optional[str]]:
+    if profile is LoadProfile.SUMMARY:
+        stmt = select(User.user_id, User.username, User.email, User.full_name, User.role)
+    else:
+        # relationships are loaded for this page of users only
+        stmt = _with_profile(select(User), profile)
+    if role is not None:
+        stmt = stmt.where(User.role == role)
+    if email_prefix:
+        stmt = stmt.where(User.email.startswith(email_prefix, autoescape=True))
+    if cursor:
+        try:
+            (last_user_id,) = decode_cursor(cursor)
+            last_user_id = cursor_id(last_user_id)
+        except (TypeError, ValueError):
+            raise ValueError('Invalid cursor')
+        stmt = stmt.where(User.user_id > last_user_id)
+    result = await session.execute(stmt.order_by(User.user_id).limit(limit + 1))
+    users = result.all() if profile is LoadProfile.SUMMARY else result.scalars().all()
+    if len(users) <= limit:
+        return users, None
+    users = users[:limit]
+    return users, encode_cursor(users[-1].user_id)
 
 
 async def create_user(session: AsyncSession, user_data: UserCreate) -> User:
@@ -46,7 +93,7 @@ async def create_user(session: AsyncSession, user_data: UserCreate) -> User:
         username=user_data.username,
         email=user_data.email,
         full_name=user_data.full_name,
-        hashed_password=hash_password(user_data.password),
+        hashed_password=await hash_password(user_data.password),
     )
     session.add(user)
     try:
@@ -67,7 +114,7 @@ async def create_user(session: AsyncSession, user_data: UserCreate) -> User:
 
 
 async def update_user(session: AsyncSession, user_id: int, user_data: UserUpdate) -> User:
-    user = await get_user_by_id(session, user_id)
+    user = await get_user_by_id(session, user_id, LoadProfile.SUMMARY)
     if not user:
         raise ValueError('User not found')
 
@@ -78,11 +125,12 @@ async def update_user(session: AsyncSession, user_id: int, user_data: UserUpdate
     if user_data.full_name:
         user.full_name = user_data.full_name
     if user_data.password:
-        user.hashed_password = hash_password(user_data.password)
+        user.hashed_password = await hash_password(user_data.password)
 
     session.add(user)
     try:
         await session.commit()
+        await cache.invalidate_users(user_id)
         user_with_accounts = await get_user_by_id(session, user.user_id)
         return user_with_accounts
     except Exception as e:
@@ -97,9 +145,11 @@ async def update_user(session: AsyncSession, user_id: int, user_data: UserUpdate
 
 
 async def delete_user(session: AsyncSession, user_id: int) -> bool:
-    user = await get_user_by_id(session, user_id)
+    # accounts and transactions go away through ON DELETE CASCADE (passive_deletes)
+    user = await get_user_by_id(session, user_id, LoadProfile.SUMMARY)
     if not user:
         return False
     await session.delete(user)
     await session.commit()
+    await cache.invalidate_users(user_id)
     return True
@@ -0,0 +1,123 @@
+import asyncio
+import datetime
+from typing import List, Optional
+
+from sanic.log import logger
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncConnection, AsyncEngine
+
+from webapp.models.billing.transaction import Transaction
+
+SCHEMA = Transaction.__table__.schema
+TABLE = Transaction.__table__.name
+
+
+def month_start(day: datetime.date) -> datetime.date:
+    return day.replace(day=1)
+
+
+def next_month(day: datetime.date) -> datetime.date:
+    return (month_start(day) + datetime.timedelta(days=32)).replace(day=1)
+
+
+def partition_name(month: datetime.date) -> str:
+    return f'{TABLE}_{month:%Y%m}'
+
+
+async def is_partitioned(conn: AsyncConnection) -> bool:
+    return await conn.scalar(
+        text(
+            'SELECT EXISTS (SELECT 1 FROM pg_partitioned_table '
+            'JOIN pg_class ON pg_class.oid = pg_partitioned_table.partrelid '
+            'JOIN pg_namespace ns ON ns.oid = pg_class.relnamespace '
+            'WHERE ns.nspname = :schema AND pg_class.relname = :table)'
+        ),
+        {'schema': SCHEMA, 'table': TABLE},
+    )
+
+
+async def existing_partitions(conn: AsyncConnection) -> List[str]:
+    result = await conn.execute(
+        text(
+            'SELECT child.relname FROM pg_inherits '
+            'JOIN pg_class parent ON parent.oid = pg_inherits.inhparent '
+            'JOIN pg_class child ON child.oid = pg_inherits.inhrelid '
+            'JOIN pg_namespace ns ON ns.oid = parent.relnamespace '
+            'WHERE ns.nspname = :schema AND parent.relname = :table'
+        ),
+        {'schema': SCHEMA, 'table': TABLE},
+    )
+    return list(result.scalars())
+
+
+async def ensure_partitions(
+    conn: AsyncConnection, months_ahead: int, since: Optional[datetime.date] = None
+) -> List[str]:
+    '''
+    Creates the monthly partitions of billing.transaction from since (default: the current month)
+    through months_ahead months after the current one, plus the DEFAULT partition. Returns the
+    names of the partitions it created. Runs in the caller's transaction.
+    '''
+    # several workers run this on startup, serialize them instead of racing on the catalog
+    await conn.execute(text('SELECT pg_advisory_xact_lock(hashtext(:key))'), {'key': f'{SCHEMA}.{TABLE} partitions'})
+    existing = set(await existing_partitions(conn))
+    created = []
+
+    default = f'{TABLE}_default'
+    if default not in existing:
+        # catches rows outside the created months (old fixtures, clock skew) instead of failing the insert
+        await conn.execute(text(f'CREATE TABLE "{SCHEMA}"."{default}" PARTITION OF "{SCHEMA}"."{TABLE}" DEFAULT'))
+        created.append(default)
+
+    month = month_start(since or datetime.date.today())
+    last = month_start(datetime.date.today())
+    for _ in range(months_ahead):
+        last = next_month(last)
+    while month <= last:
+        name = partition_name(month)
+        if name not in existing:
+            await _create_partition(conn, name, month, next_month(month), default)
+            created.append(name)
+        month = next_month(month)
+    return created
+
+
+async def _create_partition(
+    conn: AsyncConnection, name: str, month: datetime.date, until: datetime.date, default: str
+) -> None:
+    bounds = f"FOR VALUES FROM ('{month}') TO ('{until}')"
+    # timestamp is a timestamp column, asyncpg wants datetimes for it
+    params = {
+        'month': datetime.datetime.combine(month, datetime.time()),
+        'until': datetime.datetime.combine(until, datetime.time()),
+    }
+    in_default = await conn.scalar(
+        text(f'SELECT EXISTS (SELECT 1 FROM "{SCHEMA}"."{default}" WHERE timestamp >= :month AND timestamp < :until)'),
+        params,
+    )
+    if not in_default:
+        await conn.execute(text(f'CREATE TABLE "{SCHEMA}"."{name}" PARTITION OF "{SCHEMA}"."{TABLE}" {bounds}'))
+        return
+    # the DEFAULT partition already holds rows of this month: move them out, then attach the filled table
+    await conn.execute(text(f'CREATE TABLE "{SCHEMA}"."{name}" (LIKE "{SCHEMA}"."{TABLE}" INCLUDING DEFAULTS)'))
+    await conn.execute(
+        text(
+            f'WITH moved AS (DELETE FROM "{SCHEMA}"."{default}" WHERE timestamp >= :month AND timestamp < :until '
+            f'RETURNING *) INSERT INTO "{SCHEMA}"."{name}" SELECT * FROM moved'
+        ),
+        params,
+    )
+    await conn.execute(text(f'ALTER TABLE "{SCHEMA}"."{TABLE}" ATTACH PARTITION "{SCHEMA}"."{name}" {bounds}'))
+
+
+async def maintain_partitions(engine: AsyncEngine, months_ahead: int, interval: float = 6 * 3600) -> None:
+    # keeps months_ahead empty partitions ready for as long as the server runs
+    while True:
+        try:
+            async with engine.begin() as conn:
+                created = await ensure_partitions(conn, months_ahead)
+            if created:
+                logger.info('Created transaction partitions: %s', ', '.join(created))
+        except Exception:
+            logger.exception('Failed to create transaction partitions')
+        await asyncio.sleep(interval)
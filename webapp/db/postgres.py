@@ -1,18 +1,64 @@
-from typing import AsyncGenerator
+import time
+import asyncio
+from typing import AsyncGenerator, Optional, Tuple
+from uuid import uuid4
 
 from sqlalchemy import AsyncAdaptedQueuePool
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
 from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, async_sessionmaker, create_async_engine
 
 from conf import settings
+from webapp.utils import metrics
 
 
-def create_engine() -> AsyncEngine:
+def _connect_args() -> dict:
+    if settings.DB_PGBOUNCER_MODE:
+        # PgBouncer in transaction mode may hand each transaction a different server connection,
+        # so statements can't stay prepared between executions and their names must not collide
+        return {
+            'statement_cache_size': 0,
+            'prepared_statement_cache_size': 0,
+            'prepared_statement_name_func': lambda: f'__asyncpg_{uuid4()}__',
+        }
+    return {
+        'statement_cache_size': settings.DB_STATEMENT_CACHE_SIZE,
+        'prepared_statement_cache_size': settings.DB_STATEMENT_CACHE_SIZE,
+    }
+
+
+class InstrumentedPool(AsyncAdaptedQueuePool):
+    # times every checkout, which is where requests queue up once pool_size + max_overflow are in use
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            return super()._do_get()
+        except PoolTimeoutError:
+            metrics.db_pool_timeouts.inc()
+            raise
+        finally:
+            metrics.db_pool_checkout.observe(value=time.perf_counter() - started)
+
+
+def pool_limits(budget: int, workers: int) -> Tuple[int, int]:
+    # splits a connection budget shared by all workers into each worker's pool_size and max_overflow:
+    # three quarters kept open, the rest only under load
+    if budget < workers:
+        raise ValueError(f'DB_CONNECTION_BUDGET of {budget} is less than one connection for each of {workers} workers')
+    per_worker = budget // max(1, workers)
+    pool_size = max(1, per_worker * 3 // 4)
+    return pool_size, per_worker - pool_size
+
+
+def create_engine(pool_size: Optional[int] = None, max_overflow: Optional[int] = None) -> AsyncEngine:
     return create_async_engine(
         settings.DB_URL,
-        poolclass=AsyncAdaptedQueuePool,
-        connect_args={
-            'statement_cache_size': 0,
-        },
+        poolclass=InstrumentedPool,
+        pool_size=settings.DB_POOL_SIZE if pool_size is None else pool_size,
+        max_overflow=settings.DB_MAX_OVERFLOW if max_overflow is None else max_overflow,
+        pool_timeout=settings.DB_POOL_TIMEOUT,
+        pool_recycle=settings.DB_POOL_RECYCLE,
+        pool_pre_ping=settings.DB_POOL_PRE_PING,
+        connect_args=_connect_args(),
     )
 
 
@@ -27,10 +73,68 @@ def create_session(
     )
 
 
-engine = create_engine()
-async_session = create_session(engine)
+# engine and async_session are created on first use: scripts take them as they are, a web worker
+# installs its own engine with use_engine() in before_server_start. Read them as postgres.engine and
+# postgres.async_session, a name imported with `from ... import` keeps whatever engine was bound then.
+_engine: AsyncEngine | None = None
+_async_session: async_sessionmaker[AsyncSession] | None = None
+
+
+def use_engine(new_engine: AsyncEngine) -> None:
+    global _engine, _async_session
+    _engine = new_engine
+    if _async_session is None:
+        _async_session = create_session(new_engine)
+    else:
+        _async_session.configure(bind=new_engine)
+
+
+def _session_factory() -> async_sessionmaker[AsyncSession]:
+    if _async_session is None:
+        use_engine(create_engine())
+    return _async_session
+
+
+def __getattr__(name: str):
+    if name == 'engine':
+        _session_factory()
+        return _engine
+    if name == 'async_session':
+        return _session_factory()
+    raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
+
+
+async def warm_up(target: AsyncEngine, connections: int) -> None:
+    # opens the connections (and lets asyncpg load its type codecs) before the worker takes traffic
+    opened = [target.connect() for _ in range(connections)]
+    try:
+        await asyncio.gather(*(connection.start() for connection in opened))
+        await asyncio.gather(*(connection.exec_driver_sql('SELECT 1') for connection in opened))
+    finally:
+        await asyncio.gather(*(connection.close() for connection in opened), return_exceptions=True)
+
+
+class LazySession:
+    # Stands in for request.ctx.session: the AsyncSession is created the first time a handler
+    # enters it, so requests that never touch the database never touch the pool either.
+    def __init__(self, session_factory: async_sessionmaker[AsyncSession]) -> None:
+        self._session_factory = session_factory
+        self._session: AsyncSession | None = None
+
+    async def __aenter__(self) -> AsyncSession:
+        if self._session is None:
+            self._session = self._session_factory()
+        return await self._session.__aenter__()
+
+    async def __aexit__(self, *exc_info) -> None:
+        await self._session.__aexit__(*exc_info)
+
+    async def close(self) -> None:
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
 
 
 async def get_session() -> AsyncGenerator[AsyncSession, None]:
-    async with async_session() as session:
+    async with _session_factory()() as session:
         yield session
@@ -1,3 +1,5 @@
 from .account import Account
+from .account_rollup import AccountRollup
 from .transaction import Transaction
+from .transaction_key import TransactionKey
 from .user import User
@@ -1,6 +1,6 @@
 import datetime
 
-from sqlalchemy import DateTime, ForeignKey, Integer, String
+from sqlalchemy import DateTime, ForeignKey, Index, Integer, String
 from sqlalchemy.orm import Mapped, mapped_column, relationship
 
 from webapp.models.meta import DEFAULT_SCHEMA, Base
@@ -8,9 +8,13 @@ from webapp.models.meta import DEFAULT_SCHEMA, Base
 
 class Account(Base):
     __tablename__ = 'account'
-    __table_args__ = {'schema': DEFAULT_SCHEMA}
+    __table_args__ = (
+        # /account/my and the user delete cascade look accounts up by owner
+        Index('ix_account_user_id', 'user_id'),
+        {'schema': DEFAULT_SCHEMA},
+    )
 
-    id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True, index=True)
+    id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
     account_id: Mapped[int] = mapped_column(Integer, nullable=False, unique=True)
     account_name: Mapped[str] = mapped_column(String, nullable=True)
     user_id: Mapped[int] = mapped_column(
@@ -21,5 +25,5 @@ class Account(Base):
 
     user = relationship('User', back_populates='accounts')
     transactions = relationship(
-        'Transaction', back_populates='account', cascade='all, delete-orphan', passive_deletes=True, lazy='selectin'
+        'Transaction', back_populates='account', cascade='all, delete-orphan', passive_deletes=True, lazy='raise'
     )
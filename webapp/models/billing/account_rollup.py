@@ -0,0 +1,25 @@
+import datetime
+
+from sqlalchemy import Date, ForeignKey, Index, Integer, Numeric
+from sqlalchemy.orm import Mapped, mapped_column
+
+from webapp.models.meta import DEFAULT_SCHEMA, Base
+
+
+class AccountRollup(Base):
+    # daily inflow per account, maintained by the ingestion statement and rebuilt by scripts/backfill_rollups.py
+    __tablename__ = 'account_rollup'
+    __table_args__ = (
+        Index('ix_account_rollup_user_id_bucket', 'user_id', 'bucket'),
+        {'schema': DEFAULT_SCHEMA},
+    )
+
+    account_id: Mapped[int] = mapped_column(
+        ForeignKey(f'{DEFAULT_SCHEMA}.account.account_id', ondelete='CASCADE'), primary_key=True
+    )
+    bucket: Mapped[datetime.date] = mapped_column(Date, primary_key=True)
+    user_id: Mapped[int] = mapped_column(
+        ForeignKey(f'{DEFAULT_SCHEMA}.user.user_id', ondelete='CASCADE'), nullable=False
+    )
+    total: Mapped[float] = mapped_column(Numeric(18, 2), nullable=False, default=0)
+    count: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
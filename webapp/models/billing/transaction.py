@@ -1,17 +1,28 @@
 import datetime
 
-from sqlalchemy import DateTime, ForeignKey, Integer, Numeric, String
+from sqlalchemy import DateTime, ForeignKey, Index, Integer, Numeric, PrimaryKeyConstraint, String
 from sqlalchemy.orm import Mapped, mapped_column, relationship
 
+from conf import settings
 from webapp.models.meta import DEFAULT_SCHEMA, Base
 
+PARTITIONED = settings.TRANSACTION_PARTITIONING
+
 
 class Transaction(Base):
     __tablename__ = 'transaction'
-    __table_args__ = ({'schema': DEFAULT_SCHEMA},)
+    __table_args__ = (
+        # keyset pagination on (timestamp, id) for the listing endpoints
+        Index('ix_transaction_user_id_timestamp_id', 'user_id', 'timestamp', 'id'),
+        Index('ix_transaction_account_id_timestamp_id', 'account_id', 'timestamp', 'id'),
+        # partitioned by month on timestamp (webapp/db/partitioning.py), the partition key has to be part
+        # of the primary key and transaction_id uniqueness moves to billing.transaction_key
+        PrimaryKeyConstraint('id', 'timestamp') if PARTITIONED else PrimaryKeyConstraint('id'),
+        {'schema': DEFAULT_SCHEMA, 'postgresql_partition_by': 'RANGE (timestamp)' if PARTITIONED else None},
+    )
 
-    id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True, index=True)
-    transaction_id: Mapped[str] = mapped_column(String, unique=True, nullable=False)
+    id: Mapped[int] = mapped_column(Integer, autoincrement=True)
+    transaction_id: Mapped[str] = mapped_column(String, unique=not PARTITIONED, nullable=False)
     account_id: Mapped[int] = mapped_column(
         ForeignKey(f'{DEFAULT_SCHEMA}.account.account_id', ondelete='CASCADE'),
         nullable=False,
@@ -21,7 +32,7 @@ class Transaction(Base):
         ForeignKey(f'{DEFAULT_SCHEMA}.user.user_id', ondelete='CASCADE'), nullable=False
     )
     amount: Mapped[float] = mapped_column(Numeric(18, 2), nullable=False)
-    timestamp: Mapped[datetime.datetime] = mapped_column(DateTime, default=datetime.datetime.now())
+    timestamp: Mapped[datetime.datetime] = mapped_column(DateTime, default=datetime.datetime.now)
     signature: Mapped[str] = mapped_column(String, nullable=False)
 
     account = relationship('Account', back_populates='transactions')
@@ -0,0 +1,22 @@
+from sqlalchemy import ForeignKey, MetaData, String
+from sqlalchemy.orm import Mapped, mapped_column
+
+from conf import settings
+from webapp.models import meta
+from webapp.models.meta import DEFAULT_SCHEMA, Base
+
+
+class TransactionKey(Base):
+    # A partitioned table can only enforce uniqueness together with the partition key, so with
+    # TRANSACTION_PARTITIONING this registry is what keeps transaction_id globally unique. Without
+    # it the table goes into a metadata of its own, so create_all and the migrations leave it out.
+    __tablename__ = 'transaction_key'
+    __table_args__ = {'schema': DEFAULT_SCHEMA}
+    metadata = (
+        meta.metadata if settings.TRANSACTION_PARTITIONING else MetaData(naming_convention=meta.NAMING_CONVENTION)
+    )
+
+    transaction_id: Mapped[str] = mapped_column(String, primary_key=True)
+    user_id: Mapped[int] = mapped_column(
+        ForeignKey(f'{DEFAULT_SCHEMA}.user.user_id', ondelete='CASCADE'), nullable=False, index=True
+    )
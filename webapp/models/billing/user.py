@@ -8,7 +8,7 @@ class User(Base):
     __tablename__ = 'user'
     __table_args__ = ({'schema': DEFAULT_SCHEMA},)
 
-    user_id: Mapped[int] = mapped_column(Integer, primary_key=True, index=True)
+    user_id: Mapped[int] = mapped_column(Integer, primary_key=True)
     username: Mapped[str] = mapped_column(String, unique=True)
     hashed_password: Mapped[str] = mapped_column(String)
     email: Mapped[str] = mapped_column(String, unique=True)
@@ -20,6 +20,7 @@ class User(Base):
         back_populates='user',
         cascade='all, delete-orphan',
         passive_deletes=True,
+        lazy='raise',
     )
 
     transactions = relationship(
@@ -27,4 +28,5 @@ class User(Base):
         back_populates='user',
         cascade='all, delete-orphan',
         passive_deletes=True,
+        lazy='raise',
     )
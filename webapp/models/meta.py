@@ -15,5 +15,8 @@ NAMING_CONVENTION = {
 
 DEFAULT_SCHEMA = 'billing'
 
+# duplicates of primary keys, dropped by scripts/migrate.py to spare every insert an extra btree
+RETIRED_INDEXES = ['ix_billing_user_user_id', 'ix_billing_account_id', 'ix_billing_transaction_id']
+
 metadata = MetaData(naming_convention=NAMING_CONVENTION)
 Base = declarative_base(metadata=metadata)
@@ -0,0 +1,24 @@
+from datetime import date
+from decimal import Decimal
+from typing import Literal, Optional
+
+from pydantic import BaseModel, Field
+
+
+class StatisticsQuery(BaseModel):
+    period: Literal['day', 'month'] = 'day'
+    date_from: Optional[date] = Field(None, alias='from')
+    date_to: Optional[date] = Field(None, alias='to')
+    account_id: Optional[int] = None
+
+
+class StatisticsBucket(BaseModel):
+    bucket: date
+    total: Decimal
+    count: int
+
+
+class Statistics(BaseModel):
+    period: Literal['day', 'month']
+    account_id: Optional[int] = None
+    items: list[StatisticsBucket]
@@ -1,14 +1,18 @@
-from datetime import datetime
+from datetime import datetime, timezone
 from decimal import Decimal
+from typing import Literal, Optional
 from uuid import UUID
 
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, Field, field_validator
+
+from webapp.utils.pagination import INT4_MAX, INT4_MIN
 
 
 class TransactionCreate(BaseModel):
     transaction_id: UUID = Field(..., example='5eae174f-7cd0-472c-bd36-35660f00132b')
-    account_id: int = Field(..., example=1)
-    user_id: int = Field(..., example=1)
+    # integer columns: a larger id would fail the whole insert statement instead of this event
+    account_id: int = Field(..., example=1, ge=INT4_MIN, le=INT4_MAX)
+    user_id: int = Field(..., example=1, ge=INT4_MIN, le=INT4_MAX)
     amount: Decimal = Field(..., example='100')
     signature: str = Field(..., example='7b47e41efe564a062029da3367bde8844bea0fb049f894687cee5d57f2858bc8')
 
@@ -17,3 +21,37 @@ class TransactionRead(TransactionCreate):
     id: int
     timestamp: datetime
     signature: str
+
+
+class TransactionTimeRange(BaseModel):
+    date_from: Optional[datetime] = Field(None, alias='from')
+    date_to: Optional[datetime] = Field(None, alias='to')
+
+    @field_validator('date_from', 'date_to')
+    @classmethod
+    def to_naive_utc(cls, value: Optional[datetime]) -> Optional[datetime]:
+        # billing.transaction.timestamp is stored without time zone
+        if value is not None and value.tzinfo is not None:
+            value = value.astimezone(timezone.utc).replace(tzinfo=None)
+        return value
+
+
+class TransactionListQuery(TransactionTimeRange):
+    limit: Optional[int] = Field(None, ge=1)
+    cursor: Optional[str] = None
+
+
+class TransactionExportQuery(TransactionTimeRange):
+    format: Literal['csv', 'ndjson'] = 'csv'
+    account_id: Optional[int] = None
+
+
+class TransactionPage(BaseModel):
+    items: list[TransactionRead]
+    next_cursor: Optional[str] = None
+
+
+class TransactionBatchItem(BaseModel):
+    transaction_id: Optional[str] = None
+    status: Literal['created', 'duplicate', 'invalid', 'invalid_signature', 'rejected']
+    error: Optional[str] = None
@@ -1,8 +1,10 @@
-from typing import List, Optional
+from typing import Generic, List, Literal, Optional, TypeVar
 
 from pydantic import BaseModel, EmailStr, Field
 
-from webapp.schema.account.account import AccountRead
+from webapp.schema.account.account import AccountRead, AccountsReadShort
+
+UserT = TypeVar('UserT')
 
 
 class UserCreate(BaseModel):
@@ -26,3 +28,28 @@ class UserRead(BaseModel):
     full_name: str
     role: str = 'user'
     accounts: List[AccountRead] = []
+
+
+class UserShort(BaseModel):
+    user_id: int
+    username: str
+    email: EmailStr
+    full_name: str
+    role: str = 'user'
+
+
+class UserWithAccounts(UserShort):
+    accounts: List[AccountsReadShort] = []
+
+
+class UserListQuery(BaseModel):
+    limit: Optional[int] = Field(None, ge=1)
+    cursor: Optional[str] = None
+    role: Optional[str] = None
+    email: Optional[str] = None
+    embed: Optional[Literal['accounts', 'transactions']] = None
+
+
+class UserPage(BaseModel, Generic[UserT]):
+    items: List[UserT]
+    next_cursor: Optional[str] = None
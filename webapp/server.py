@@ -1,24 +1,248 @@
+import os
+import time
+import tempfile
+from multiprocessing import Value
+
 from sanic import Blueprint, Sanic
-from sqlalchemy.ext.asyncio import AsyncSession
+from sanic.log import logger
 
-from conf import MySanicConfig
+from conf import MySanicConfig, settings
 from webapp.api.account.router import bp_account, bp_transaction
 from webapp.api.login.router import bp_auth, bp_user
-from webapp.db.postgres import async_session
+from webapp.api.metrics.router import bp_metrics
+from webapp.crud import transaction as crud_transaction
+from webapp.db import postgres
+from webapp.db.partitioning import maintain_partitions
+from webapp.db.postgres import LazySession
+from webapp.utils import metrics, profiling
+from webapp.utils.auth.jwt import jwt_auth
+from webapp.utils.idempotency import idempotency_filter
+from webapp.utils.logs import LogPipeline
+from webapp.utils.write_behind import WriteBehindQueue
+
+
+def worker_count(app: Sanic) -> int:
+    # app.state.workers is only set in the process that started the server: a single-process server
+    # has it, the workers get it from the main process through the shared context
+    shared = getattr(app.shared_ctx, 'workers', None)
+    return shared.value if shared is not None else max(app.state.workers, 1)
+
+
+def register_metrics(app: Sanic) -> None:
+    # one directory per server, named after the main process: it is the parent of the workers,
+    # and a single-process server is its own main process
+    single_process = 'SANIC_WORKER_NAME' not in os.environ
+    server_pid = os.getpid() if single_process else os.getppid()
+    app.ctx.metrics = metrics.MultiprocessDirectory(
+        metrics.registry,
+        os.path.join(settings.METRICS_DIR or tempfile.gettempdir(), f'billing-metrics-{server_pid}'),
+        settings.METRICS_WRITE_INTERVAL,
+    )
+
+    @app.main_process_start
+    async def clear_metrics(app):
+        app.ctx.metrics.clear()
+
+    @app.main_process_stop
+    async def remove_metrics(app):
+        app.ctx.metrics.remove()
+
+    @app.before_server_start
+    async def write_metrics(app):
+        if single_process:
+            # Sanic runs the main process listeners only when it starts workers
+            app.ctx.metrics.clear()
+        app.add_task(app.ctx.metrics.run(), name='metrics')
+
+    @app.after_server_stop
+    async def write_final_metrics(app):
+        if single_process:
+            app.ctx.metrics.remove()
+        else:
+            app.ctx.metrics.write()
+
+    @app.middleware('request')
+    async def start_timer(request):
+        # unmatched paths share one label, so scanners can't blow up the number of series
+        request.ctx.metrics_route = f'/{request.route.path}' if request.route else 'unmatched'
+        request.ctx.started = time.perf_counter()
+        metrics.http_in_flight.inc(request.ctx.metrics_route)
+
+    @app.middleware('response')
+    async def observe_latency(request, response):
+        started = getattr(request.ctx, 'started', None)
+        if started is None:
+            return
+        route = request.ctx.metrics_route
+        metrics.http_in_flight.dec(route)
+        metrics.http_requests.observe(route, request.method, str(response.status), value=time.perf_counter() - started)
+
+    def pool_state() -> dict:
+        pool = postgres.engine.pool
+        return {
+            ('size',): pool.size(),
+            ('checked_out',): pool.checkedout(),
+            ('checked_in',): pool.checkedin(),
+            ('overflow',): max(pool.overflow(), 0),
+        }
+
+    metrics.registry.register(metrics.GaugeFunc('db_pool_connections', 'Connection pool state', ['state'], pool_state))
+    metrics.registry.register(
+        metrics.GaugeFunc(
+            'idempotency_filter',
+            'Transaction ids known to be stored: size, hits and misses',
+            ['stat'],
+            lambda: {(stat,): value for stat, value in idempotency_filter.stats().items()},
+        )
+    )
+    metrics.registry.register(
+        metrics.GaugeFunc(
+            'jwt_cache',
+            'Verified token cache: size, hits, misses and evictions',
+            ['stat'],
+            lambda: {(stat,): value for stat, value in jwt_auth.cache_stats().items()},
+        )
+    )
+    if settings.WEBHOOK_WRITE_BEHIND:
+        metrics.registry.register(
+            metrics.GaugeFunc(
+                'webhook_queue_depth',
+                'Webhook events waiting for a group commit',
+                [],
+                lambda: {(): app.ctx.write_behind.queue.qsize()},
+            )
+        )
+    app.blueprint(bp_metrics)
+
+
+def register_profiling(app: Sanic) -> None:
+    @app.middleware('request')
+    async def start_profile(request):
+        request.ctx.profile = profiling.start()
+
+    @app.middleware('response')
+    async def report_profile(request, response):
+        profile: profiling.RequestProfile = getattr(request.ctx, 'profile', None)
+        if profile is None:
+            return
+        if profile.timings:
+            response.headers['Server-Timing'] = profile.server_timing()
+        if settings.QUERY_REPEAT_WARNING:
+            for statement, count in profile.repeated(settings.QUERY_REPEAT_WARNING).items():
+                logger.warning(
+                    '%s %s ran the same statement %d times, N+1 loading? %s',
+                    request.method,
+                    request.path,
+                    count,
+                    statement[: settings.SLOW_QUERY_LOG_LENGTH],
+                )
 
 
 def create_app() -> Sanic:
     app = Sanic('BillingApp', config=MySanicConfig())
+    # every worker process keeps its own queue, spool segments and metrics
+    worker_name = os.environ.get('SANIC_WORKER_NAME', 'main')
+
+    if settings.LOG_ASYNC or settings.LOG_FORMAT == 'json' or settings.LOG_SAMPLING:
+        app.ctx.log_pipeline = LogPipeline(
+            settings.LOG_QUEUE_SIZE if settings.LOG_ASYNC else 0, settings.LOG_FORMAT == 'json', settings.LOG_SAMPLING
+        )
+
+        # registered first, so the queue is flushed after the other after_server_stop listeners have logged
+        @app.before_server_start
+        async def start_log_pipeline(app):
+            app.ctx.log_pipeline.start()
+
+        @app.after_server_stop
+        async def stop_log_pipeline(app):
+            app.ctx.log_pipeline.stop()
+
+    @app.main_process_start
+    async def share_worker_count(app):
+        # --fast or --workers on the command line override WEB_WORKERS, the budget is split by the real count
+        if settings.DB_CONNECTION_BUDGET:
+            # raises before any worker starts when the budget can't give each one a connection
+            postgres.pool_limits(settings.DB_CONNECTION_BUDGET, app.state.workers)
+        app.shared_ctx.workers = Value('i', app.state.workers)
+
+    @app.before_server_start
+    async def open_engine(app):
+        # built in the worker: no pool state crosses process boundaries, and the pools of all
+        # workers together stay within DB_CONNECTION_BUDGET
+        pool_size, max_overflow = settings.DB_POOL_SIZE, settings.DB_MAX_OVERFLOW
+        if settings.DB_CONNECTION_BUDGET:
+            pool_size, max_overflow = postgres.pool_limits(settings.DB_CONNECTION_BUDGET, worker_count(app))
+        app.ctx.engine = postgres.create_engine(pool_size, max_overflow)
+        postgres.use_engine(app.ctx.engine)
+        if settings.SQL_PROFILING or settings.SLOW_QUERY_MS:
+            profiling.instrument(app.ctx.engine)
+        logger.info('Database pool of %s: %d connections, %d overflow', worker_name, pool_size, max_overflow)
+        if settings.DB_POOL_WARMUP:
+            try:
+                await postgres.warm_up(app.ctx.engine, pool_size)
+            except Exception:
+                logger.exception('Could not warm up the database pool, connecting on demand')
+
+    # after_server_stop runs in reverse order: the engine goes last, once the write-behind queue is drained
+    @app.after_server_stop
+    async def close_engine(app):
+        await app.ctx.engine.dispose()
+
+    if settings.METRICS_ENABLED:
+        # registered first: its response middleware then runs last and times the whole request
+        register_metrics(app)
+    if settings.SQL_PROFILING:
+        register_profiling(app)
 
     @app.middleware('request')
     async def open_session(request):
-        request.ctx.session = await async_session().__aenter__()
+        request.ctx.session = LazySession(postgres.async_session)
 
     @app.middleware('response')
     async def close_session(request, response):
-        session: AsyncSession = getattr(request.ctx, 'session', None)
+        # also runs for error responses, so a session opened by a failed handler is released here
+        session: LazySession = getattr(request.ctx, 'session', None)
         if session:
-            await session.__aexit__(None, None, None)
+            await session.close()
+
+    if settings.TRANSACTION_PARTITIONING:
+
+        @app.before_server_start
+        async def start_partition_maintenance(app):
+            app.add_task(maintain_partitions(app.ctx.engine, settings.TRANSACTION_PARTITIONS_AHEAD), name='partitions')
+
+    if settings.IDEMPOTENCY_CACHE_SIZE and settings.IDEMPOTENCY_SEED_SIZE:
+
+        @app.before_server_start
+        async def seed_idempotency_filter(app):
+            try:
+                async with postgres.async_session() as session:
+                    transaction_ids = await crud_transaction.get_recent_transaction_ids(
+                        session, min(settings.IDEMPOTENCY_SEED_SIZE, settings.IDEMPOTENCY_CACHE_SIZE)
+                    )
+            except Exception:
+                # only saves database round trips, the filter fills up from the webhooks instead
+                logger.exception('Could not seed the idempotency filter, starting with an empty one')
+                return
+            # oldest first, so the most recent ids end up least likely to be evicted
+            idempotency_filter.add(reversed(transaction_ids))
+
+    if settings.WEBHOOK_WRITE_BEHIND:
+        app.ctx.write_behind = WriteBehindQueue(
+            settings.WEBHOOK_QUEUE_MAX_SIZE,
+            settings.WEBHOOK_GROUP_COMMIT_SIZE,
+            settings.WEBHOOK_GROUP_COMMIT_INTERVAL,
+            settings.WEBHOOK_SPOOL_PATH,
+            settings.WEBHOOK_SPOOL_FSYNC,
+        )
+
+        @app.before_server_start
+        async def start_write_behind(app):
+            await app.ctx.write_behind.start()
+
+        @app.after_server_stop
+        async def stop_write_behind(app):
+            await app.ctx.write_behind.stop()
 
     content = Blueprint.group(bp_user, bp_auth, bp_account, bp_transaction, url_prefix='/api/v1')
     app.blueprint(content)
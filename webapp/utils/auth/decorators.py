@@ -6,6 +6,7 @@ from sanic.request import Request
 from sanic.response import json
 
 from webapp.utils.auth.jwt import jwt_auth
+from webapp.utils.profiling import timed
 
 
 def protected():
@@ -13,7 +14,8 @@ def protected():
         @wraps(f)
         async def decorated_function(request: Request, *args, **kwargs):
             try:
-                user_data = jwt_auth.get_current_user(request)
+                with timed('auth'):
+                    user_data = jwt_auth.get_current_user(request)
                 request.ctx.user = user_data
             except Unauthorized as e:
                 logger.warning('Protected route %s is not authorized', request.path)
@@ -1,7 +1,9 @@
+import time
 import uuid
-from dataclasses import dataclass
+from collections import OrderedDict
+from dataclasses import dataclass, field
 from datetime import datetime, timedelta, timezone
-from typing import TypedDict, cast
+from typing import Dict, TypedDict, cast
 
 from authlib.jose import JoseError, jwt
 from sanic.exceptions import Unauthorized
@@ -21,6 +23,12 @@ class JwtTokenT(TypedDict):
 class JwtAuth:
     secret: str
     alg: str = 'HS256'
+    # verified claims keyed by token: clients resend the same token for its whole lifetime
+    cache_size: int = 0
+    cache_hits: int = field(default=0, init=False)
+    cache_misses: int = field(default=0, init=False)
+    cache_evictions: int = field(default=0, init=False)
+    _cache: OrderedDict[str, JwtTokenT] = field(default_factory=OrderedDict, init=False, repr=False)
 
     def create_token(self, user_id: int, role: str) -> str:
         payload = {
@@ -32,12 +40,37 @@ class JwtAuth:
         return jwt.encode({'alg': self.alg}, payload, self.secret).decode('utf-8')
 
     def decode_token(self, token: str) -> JwtTokenT:
+        claims = self._cache.get(token)
+        if claims is not None:
+            # same rule as claims.validate(): the token is valid up to and including exp
+            if claims.get('exp') is None or claims['exp'] >= int(time.time()):
+                self._cache.move_to_end(token)
+                self.cache_hits += 1
+                return claims
+            del self._cache[token]
+            self.cache_evictions += 1
+            raise Unauthorized('Invalid or expired token')
+
+        self.cache_misses += 1
         try:
             claims = jwt.decode(token, self.secret)
             claims.validate()  # проверка exp и других полей
-            return cast(JwtTokenT, claims)
         except JoseError:
             raise Unauthorized('Invalid or expired token')
+        if self.cache_size:
+            self._cache[token] = cast(JwtTokenT, claims)
+            if len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+                self.cache_evictions += 1
+        return cast(JwtTokenT, claims)
+
+    def cache_stats(self) -> Dict[str, int]:
+        return {
+            'size': len(self._cache),
+            'hits': self.cache_hits,
+            'misses': self.cache_misses,
+            'evictions': self.cache_evictions,
+        }
 
     def get_current_user(self, request: Request) -> JwtTokenT:
         auth_header = request.headers.get('authorization')
@@ -48,4 +81,4 @@ class JwtAuth:
         return self.decode_token(token)
 
 
-jwt_auth = JwtAuth(settings.JWT_SECRET_SALT)
+jwt_auth = JwtAuth(settings.JWT_SECRET_SALT, cache_size=settings.JWT_CACHE_SIZE)
@@ -1,9 +1,34 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
 import bcrypt
 
+from conf import settings
+
+# bcrypt releases the GIL, so a small thread pool keeps hashing off the event loop
+# and PASSWORD_HASH_WORKERS caps how many hashes run at once per worker process
+_executor = ThreadPoolExecutor(max_workers=settings.PASSWORD_HASH_WORKERS, thread_name_prefix='bcrypt')
+
 
-def hash_password(password: str) -> str:
-    return bcrypt.hashpw(password.encode(), bcrypt.gensalt()).decode()
+def hash_password_sync(password: str, rounds: int | None = None) -> str:
+    return bcrypt.hashpw(password.encode(), bcrypt.gensalt(rounds or settings.BCRYPT_ROUNDS)).decode()
 
 
-def verify_password(password: str, hashed: str) -> bool:
+def verify_password_sync(password: str, hashed: str) -> bool:
     return bcrypt.checkpw(password.encode(), hashed.encode())
+
+
+async def hash_password(password: str) -> str:
+    return await asyncio.get_running_loop().run_in_executor(_executor, hash_password_sync, password)
+
+
+async def verify_password(password: str, hashed: str) -> bool:
+    return await asyncio.get_running_loop().run_in_executor(_executor, verify_password_sync, password, hashed)
+
+
+def needs_rehash(hashed: str) -> bool:
+    # modular crypt format: $2b$<cost>$<salt+hash>
+    try:
+        return int(hashed.split('$')[2]) != settings.BCRYPT_ROUNDS
+    except (IndexError, ValueError):
+        return True
@@ -0,0 +1,42 @@
+from collections import OrderedDict
+from typing import Dict, Iterable
+
+from conf import settings
+
+
+class IdempotencyFilter:
+    '''
+    Bounded LRU of transaction ids known to be stored. Only ids confirmed by the database
+    are added, the write-behind queue adds its events once they are committed, so a hit
+    is always a real duplicate and can be answered without touching Postgres.
+    '''
+
+    def __init__(self, max_size: int) -> None:
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._ids: OrderedDict[str, None] = OrderedDict()
+
+    def seen(self, transaction_id: str) -> bool:
+        transaction_id = str(transaction_id)
+        if transaction_id in self._ids:
+            self._ids.move_to_end(transaction_id)
+            self.hits += 1
+            return True
+        self.misses += 1
+        return False
+
+    def add(self, transaction_ids: Iterable[str]) -> None:
+        if not self.max_size:
+            return
+        for transaction_id in map(str, transaction_ids):
+            self._ids[transaction_id] = None
+            self._ids.move_to_end(transaction_id)
+        while len(self._ids) > self.max_size:
+            self._ids.popitem(last=False)
+
+    def stats(self) -> Dict[str, int]:
+        return {'size': len(self._ids), 'hits': self.hits, 'misses': self.misses}
+
+
+idempotency_filter = IdempotencyFilter(settings.IDEMPOTENCY_CACHE_SIZE)
@@ -0,0 +1,116 @@
+import json
+import queue
+import random
+import logging
+import datetime
+from logging.handlers import QueueHandler, QueueListener
+from typing import Dict, List
+
+from sanic.log import access_logger, error_logger, logger, server_logger, websockets_logger
+
+from webapp.utils import metrics
+
+# attributes every LogRecord has, anything else was passed in extra= and goes into the JSON record
+_RECORD_ATTRIBUTES = set(vars(logging.makeLogRecord({}))) | {'message', 'asctime', 'taskName'}
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            'time': datetime.datetime.fromtimestamp(record.created, datetime.timezone.utc).isoformat(),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRIBUTES and not key.startswith('_'):
+                entry[key] = value
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+        if record.stack_info:
+            entry['stack'] = self.formatStack(record.stack_info)
+        return json.dumps(entry, default=str)
+
+
+class SamplingFilter(logging.Filter):
+    # keeps a share of the DEBUG/INFO records of each configured logger, warnings and errors always pass
+    def __init__(self, rates: Dict[str, float]) -> None:
+        super().__init__()
+        self.rates = rates
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno > logging.INFO:
+            return True
+        rate = self.rates.get(record.name)
+        return rate is None or random.random() < rate
+
+
+class LazyQueueHandler(QueueHandler):
+    '''
+    Hands records to a QueueListener thread as they are. The stock prepare() renders the message
+    on the calling thread, here msg % args (and the JSON encoding) run in the listener, so
+    arguments must not be mutated after they are logged.
+    '''
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        if record.levelno >= logging.WARNING:
+            # never dropped: waits for the listener instead
+            self.queue.put(record)
+            return
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            metrics.log_records_dropped.inc(record.name)
+
+
+class LogPipeline:
+    '''
+    Reworks the handlers of Sanic's loggers, which the webapp logs through: optional JSON records,
+    sampling of DEBUG/INFO records per logger, and with a queue size, a queue in front of the
+    handlers so formatting and writing happen in a listener thread instead of on the event loop.
+    '''
+
+    LOGGERS = (logger, error_logger, server_logger, websockets_logger, access_logger)
+
+    def __init__(self, queue_size: int, json_format: bool, sampling: Dict[str, float]) -> None:
+        self.queue_size = queue_size
+        self.json_format = json_format
+        self.sampling_filter = SamplingFilter(sampling) if sampling else None
+        self._listeners: List[QueueListener] = []
+        self._handlers: Dict[logging.Logger, List[logging.Handler]] = {}
+
+    def start(self) -> None:
+        # called once Sanic has set up its formatters in the worker, see setup_logging in sanic.worker.serve
+        for lggr in self.LOGGERS:
+            if self.sampling_filter:
+                lggr.addFilter(self.sampling_filter)
+            handlers = [handler for handler in lggr.handlers if not isinstance(handler, QueueHandler)]
+            if self.json_format:
+                for handler in handlers:
+                    handler.setFormatter(JsonFormatter())
+            if not handlers or not self.queue_size:
+                continue
+            listener = QueueListener(queue.Queue(self.queue_size), *handlers, respect_handler_level=True)
+            listener.start()
+            self._listeners.append(listener)
+            self._handlers[lggr] = handlers
+            for handler in handlers:
+                lggr.removeHandler(handler)
+            lggr.addHandler(LazyQueueHandler(listener.queue))
+
+    def stop(self) -> None:
+        # writes out what is still queued and puts the original handlers back
+        for lggr in self.LOGGERS:
+            if self.sampling_filter:
+                lggr.removeFilter(self.sampling_filter)
+            for handler in [handler for handler in lggr.handlers if isinstance(handler, LazyQueueHandler)]:
+                lggr.removeHandler(handler)
+        for listener in self._listeners:
+            listener.stop()
+        for lggr, handlers in self._handlers.items():
+            for handler in handlers:
+                lggr.addHandler(handler)
+        self._listeners, self._handlers = [], {}
@@ -0,0 +1,249 @@
+import os
+import abc
+import json
+import time
+import shutil
+import asyncio
+from bisect import bisect_left
+from pathlib import Path
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from sanic.log import logger
+
+# Prometheus text format without the client library. Every worker runs a single event loop, so
+# the collectors are plain dicts updated without locks; MultiprocessDirectory sums the values of
+# all workers, so a scrape served by any of them sees the whole server.
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+Labels = Tuple[str, ...]
+Sample = Tuple[str, Dict[str, str], float]
+
+
+def _escape(value: str) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format(name: str, labels: Dict[str, str], value: float) -> str:
+    if labels:
+        name += '{' + ','.join(f'{key}="{_escape(label)}"' for key, label in labels.items()) + '}'
+    return f'{name} {value}'
+
+
+class Metric(abc.ABC):
+    kind = 'untyped'
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> None:
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+
+    @abc.abstractmethod
+    def samples(self) -> Iterable[Sample]:
+        pass
+
+
+class Counter(Metric):
+    kind = 'counter'
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> None:
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[Labels, float] = {}
+
+    def inc(self, *labels: str, amount: float = 1) -> None:
+        self._values[labels] = self._values.get(labels, 0) + amount
+
+    def samples(self) -> Iterable[Sample]:
+        for labels, value in self._values.items():
+            yield self.name, dict(zip(self.labelnames, labels)), value
+
+
+class Gauge(Counter):
+    kind = 'gauge'
+
+    def dec(self, *labels: str, amount: float = 1) -> None:
+        self.inc(*labels, amount=-amount)
+
+    def set(self, *labels: str, value: float) -> None:
+        self._values[labels] = value
+
+
+class GaugeFunc(Metric):
+    # read at scrape time from state that is kept anyway, e.g. the connection pool
+    kind = 'gauge'
+
+    def __init__(
+        self, name: str, documentation: str, labelnames: Sequence[str], collect: Callable[[], Dict[Labels, float]]
+    ) -> None:
+        super().__init__(name, documentation, labelnames)
+        self.collect = collect
+
+    def samples(self) -> Iterable[Sample]:
+        for labels, value in self.collect().items():
+            yield self.name, dict(zip(self.labelnames, labels)), value
+
+
+class Histogram(Metric):
+    kind = 'histogram'
+
+    def __init__(
+        self, name: str, documentation: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = LATENCY_BUCKETS
+    ) -> None:
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._bounds = [f'{bound:g}' for bound in self.buckets] + ['+Inf']
+        # per label set: observations per bucket (the last one is +Inf, not cumulative yet), then the sum
+        self._values: Dict[Labels, List[float]] = {}
+
+    def observe(self, *labels: str, value: float) -> None:
+        counts = self._values.get(labels)
+        if counts is None:
+            counts = self._values[labels] = [0] * (len(self.buckets) + 2)
+        counts[bisect_left(self.buckets, value)] += 1
+        counts[-1] += value
+
+    def samples(self) -> Iterable[Sample]:
+        for labels, counts in self._values.items():
+            labels = dict(zip(self.labelnames, labels))
+            cumulative = 0
+            for bound, count in zip(self._bounds, counts):
+                cumulative += count
+                yield f'{self.name}_bucket', {**labels, 'le': bound}, cumulative
+            yield f'{self.name}_sum', labels, counts[-1]
+            yield f'{self.name}_count', labels, cumulative
+
+
+class Registry:
+    def __init__(self) -> None:
+        self._metrics: Dict[str, Metric] = {}
+
+    def register(self, metric: Metric) -> Metric:
+        self._metrics[metric.name] = metric
+        return metric
+
+    def collect(self) -> Dict[str, List[Sample]]:
+        return {metric.name: list(metric.samples()) for metric in self._metrics.values()}
+
+    def render(self, collected: Optional[Dict[str, List[Sample]]] = None) -> str:
+        if collected is None:
+            collected = self.collect()
+        lines = []
+        for metric in self._metrics.values():
+            lines.append(f'# HELP {metric.name} {metric.documentation}')
+            lines.append(f'# TYPE {metric.name} {metric.kind}')
+            for name, labels, value in collected.get(metric.name, ()):
+                lines.append(_format(name, labels, value))
+        return '\n'.join(lines) + '\n'
+
+
+class MultiprocessDirectory:
+    '''
+    Shares the samples of the worker processes: each one writes its own to <path>/<pid>.json
+    every interval and on stop, and the worker that serves a scrape sums them with its current
+    values. Counters and histograms of exited workers stay in the sums, so the totals never go
+    backwards; gauges only count for workers that wrote within the last three intervals.
+    '''
+
+    def __init__(self, registry: Registry, path: str, interval: float) -> None:
+        self.registry = registry
+        # None once the directory failed, /metrics then shows the serving worker only
+        self.path: Optional[Path] = Path(path)
+        self.interval = interval
+
+    @property
+    def file(self) -> Path:
+        return self.path / f'{os.getpid()}.json'
+
+    def clear(self) -> None:
+        # before the workers start, the samples of an earlier server with the same pid don't count
+        if self.path is None:
+            return
+        try:
+            self.path.mkdir(parents=True, exist_ok=True)
+            for file in self.path.glob('*.json'):
+                file.unlink(missing_ok=True)
+        except OSError:
+            self._disable()
+
+    def remove(self) -> None:
+        if self.path is not None:
+            shutil.rmtree(self.path, ignore_errors=True)
+
+    def write(self) -> None:
+        if self.path is None:
+            return
+        try:
+            self.path.mkdir(parents=True, exist_ok=True)
+            temporary = self.file.with_suffix('.tmp')
+            temporary.write_text(json.dumps(self.registry.collect()))
+            # a scrape never reads a half-written file
+            os.replace(temporary, self.file)
+        except OSError:
+            self._disable()
+
+    def _disable(self) -> None:
+        logger.exception('Metrics directory %s is not usable, /metrics shows this worker only', self.path)
+        self.path = None
+
+    async def run(self) -> None:
+        while self.path is not None:
+            self.write()
+            await asyncio.sleep(self.interval)
+
+    def merge(self) -> Dict[str, List[Sample]]:
+        snapshots = [(self.registry.collect(), True)]
+        if self.path is None:
+            return snapshots[0][0]
+        live_since = time.time() - 3 * self.interval
+        for file in self.path.glob('*.json'):
+            if file == self.file:
+                continue
+            try:
+                snapshots.append((json.loads(file.read_text()), file.stat().st_mtime >= live_since))
+            except (OSError, ValueError):
+                # the worker replaced it meanwhile, its next write is picked up by the next scrape
+                continue
+        merged = {}
+        for name, metric in self.registry._metrics.items():
+            totals: Dict[tuple, float] = {}
+            for snapshot, live in snapshots:
+                if metric.kind == 'gauge' and not live:
+                    continue
+                for sample, labels, value in snapshot.get(name, ()):
+                    key = (sample, tuple(labels.items()))
+                    totals[key] = totals.get(key, 0) + value
+            merged[name] = [(sample, dict(labels), value) for (sample, labels), value in totals.items()]
+        return merged
+
+    def render(self) -> str:
+        return self.registry.render(self.merge())
+
+
+registry = Registry()
+
+http_requests = registry.register(
+    Histogram(
+        'http_request_duration_seconds',
+        'Time from the request middleware to the response middleware',
+        ['route', 'method', 'status'],
+    )
+)
+http_in_flight = registry.register(Gauge('http_requests_in_flight', 'Requests being handled', ['route']))
+db_pool_checkout = registry.register(
+    Histogram(
+        'db_pool_checkout_seconds',
+        'Time to get a connection from the pool, including waiting for a free one',
+        buckets=(0.0001, 0.0005, *LATENCY_BUCKETS),
+    )
+)
+db_pool_timeouts = registry.register(Counter('db_pool_timeouts_total', 'Checkouts that gave up after DB_POOL_TIMEOUT'))
+webhook_events = registry.register(
+    Counter('webhook_events_total', 'Payment webhook events by endpoint and outcome', ['endpoint', 'result'])
+)
+webhook_group_commits = registry.register(
+    Counter('webhook_group_commits_total', 'Write-behind group commits by outcome', ['result'])
+)
+cache_requests = registry.register(Counter('cache_requests_total', 'Read-through cache lookups', ['result']))
+log_records_dropped = registry.register(
+    Counter('log_records_dropped_total', 'DEBUG/INFO records dropped because the log queue was full', ['logger'])
+)
@@ -0,0 +1,44 @@
+import json
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from datetime import datetime
+from typing import Any, List
+
+# the id columns are int4, a forged cursor has to fail here rather than as a database error
+INT4_MIN, INT4_MAX = -(2**31), 2**31 - 1
+
+
+def encode_cursor(*values: Any) -> str:
+    raw = json.dumps([v.isoformat() if isinstance(v, datetime) else v for v in values], separators=(',', ':'))
+    return urlsafe_b64encode(raw.encode()).rstrip(b'=').decode()
+
+
+def decode_cursor(cursor: str) -> List[Any]:
+    try:
+        values = json.loads(urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+    except ValueError:
+        raise ValueError('Invalid cursor')
+    if not isinstance(values, list):
+        raise ValueError('Invalid cursor')
+    return values
+
+
+def cursor_id(value: Any) -> int:
+    try:
+        value = int(value)
+    except OverflowError:
+        # json decodes 1e400 to inf
+        raise ValueError('Invalid cursor')
+    if not INT4_MIN <= value <= INT4_MAX:
+        raise ValueError('Invalid cursor')
+    return value
+
+
+def cursor_timestamp(value: Any) -> datetime:
+    timestamp = datetime.fromisoformat(value)
+    if timestamp.tzinfo is not None:
+        # the timestamp columns hold naive local time, as written by datetime.now()
+        try:
+            timestamp = timestamp.astimezone().replace(tzinfo=None)
+        except OverflowError:
+            raise ValueError('Invalid cursor')
+    return timestamp
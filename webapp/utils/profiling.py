@@ -0,0 +1,106 @@
+import time
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from typing import Any, Dict, Iterator, Optional
+
+from sanic.log import logger
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+from conf import settings
+
+
+@dataclass
+class RequestProfile:
+    queries: int = 0
+    # seconds per phase: db, serialize, auth
+    timings: Dict[str, float] = field(default_factory=dict)
+    statements: Counter = field(default_factory=Counter)
+
+    def add(self, phase: str, seconds: float) -> None:
+        self.timings[phase] = self.timings.get(phase, 0) + seconds
+
+    def server_timing(self) -> str:
+        entries = []
+        for phase, seconds in self.timings.items():
+            entry = f'{phase};dur={seconds * 1000:.2f}'
+            if phase == 'db':
+                entry += f';desc="{self.queries} queries"'
+            entries.append(entry)
+        return ', '.join(entries)
+
+    def repeated(self, threshold: int) -> Dict[str, int]:
+        return {statement: count for statement, count in self.statements.items() if count > threshold}
+
+
+# set per request by the middleware in create_app; SQLAlchemy runs the sync engine events in a greenlet
+# that shares the context of the awaiting task, so the hooks see the profile of the request they serve
+_profile: ContextVar[Optional[RequestProfile]] = ContextVar('request_profile', default=None)
+
+
+def start() -> RequestProfile:
+    profile = RequestProfile()
+    _profile.set(profile)
+    return profile
+
+
+@contextmanager
+def timed(phase: str) -> Iterator[None]:
+    profile = _profile.get()
+    if profile is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        profile.add(phase, time.perf_counter() - started)
+
+
+def parameters_shape(parameters: Any) -> str:
+    # types only: the values may be passwords, emails or whole batches of rows
+    if isinstance(parameters, (list, tuple)) and parameters and isinstance(parameters[0], (list, tuple, dict)):
+        return f'{len(parameters)} x {parameters_shape(parameters[0])}'
+    if isinstance(parameters, dict):
+        return '{' + ', '.join(f'{key}: {type(value).__name__}' for key, value in parameters.items()) + '}'
+    if isinstance(parameters, (list, tuple)):
+        return '(' + ', '.join(type(value).__name__ for value in parameters) + ')'
+    return type(parameters).__name__
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany) -> None:
+    conn.info.setdefault('query_started', []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany) -> None:
+    elapsed = time.perf_counter() - conn.info['query_started'].pop()
+    profile = _profile.get()
+    if profile is not None:
+        profile.queries += 1
+        profile.add('db', elapsed)
+        profile.statements[statement] += 1
+    if settings.SLOW_QUERY_MS and elapsed * 1000 >= settings.SLOW_QUERY_MS:
+        logger.warning(
+            'Slow query (%.1f ms): %s; parameters: %s',
+            elapsed * 1000,
+            statement[: settings.SLOW_QUERY_LOG_LENGTH],
+            parameters_shape(parameters),
+        )
+
+
+def _handle_error(exception_context) -> None:
+    # a failed statement never reaches after_cursor_execute
+    started = exception_context.connection.info.get('query_started') if exception_context.connection else None
+    if started:
+        started.pop()
+
+
+def instrument(engine: AsyncEngine) -> None:
+    sync_engine = engine.sync_engine
+    if event.contains(sync_engine, 'before_cursor_execute', _before_cursor_execute):
+        return
+    event.listen(sync_engine, 'before_cursor_execute', _before_cursor_execute)
+    event.listen(sync_engine, 'after_cursor_execute', _after_cursor_execute)
+    event.listen(sync_engine, 'handle_error', _handle_error)
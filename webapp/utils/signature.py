@@ -3,8 +3,11 @@ import hashlib
 from conf import settings
 
 
-def check_signature(data: dict) -> bool:
+def make_signature(data: dict) -> str:
     keys_order = ['account_id', 'amount', 'transaction_id', 'user_id']
     raw_string = ''.join(str(data[k]) for k in keys_order) + settings.SECRET_KEY
-    gen_signature = hashlib.sha256(raw_string.encode()).hexdigest()
-    return data.get('signature') == gen_signature
+    return hashlib.sha256(raw_string.encode()).hexdigest()
+
+
+def check_signature(data: dict) -> bool:
+    return data.get('signature') == make_signature(data)
@@ -0,0 +1,258 @@
+import os
+import json
+import uuid
+import fcntl
+import asyncio
+from contextlib import suppress
+from dataclasses import dataclass
+from pathlib import Path
+from typing import List, Optional, Set, TextIO, Tuple
+
+from sanic.log import logger
+
+from webapp.crud import transaction as crud_transaction
+from webapp.db import postgres
+from webapp.utils import metrics
+from webapp.utils.idempotency import idempotency_filter
+
+# commit attempts for spooled events of an earlier run before they are left for the next start
+REPLAY_ATTEMPTS = 5
+
+
+@dataclass(eq=False)
+class Segment:
+    path: Path
+    file: TextIO
+    # events written to it and not committed yet
+    pending: int = 0
+
+
+class WriteBehindQueue:
+    '''
+    Accepts signed webhook events into a bounded in-process queue and group-commits them
+    from a background task. Every accepted event is appended to a spool segment and synced
+    before it is queued; a new segment is started with every batch and the old ones are
+    deleted once all of their events are committed. Live segments are locked, on start a
+    background task replays every unlocked segment under the spool path, whichever worker
+    wrote it. Replays are safe because ingestion skips already known transaction ids.
+    '''
+
+    def __init__(
+        self,
+        max_size: int,
+        batch_size: int,
+        batch_interval: float,
+        spool_path: Optional[str] = None,
+        fsync: bool = True,
+    ) -> None:
+        self.queue: asyncio.Queue[Tuple[Optional[Segment], dict]] = asyncio.Queue(max_size)
+        self.batch_size = batch_size
+        self.batch_interval = batch_interval
+        self.spool_path = Path(spool_path) if spool_path else None
+        self.fsync = fsync
+        # segment names of this queue, unique across workers and restarts
+        self._prefix = f'{self.spool_path.name}.{uuid.uuid4().hex[:12]}' if spool_path else None
+        self._sequence = 0
+        self._segment: Optional[Segment] = None
+        self._segments: Set[Segment] = set()
+        self._unsynced: Set[Segment] = set()
+        self._sync: Optional[asyncio.Future] = None
+        self._syncing = 0
+        self._task: Optional[asyncio.Task] = None
+        self._replay_task: Optional[asyncio.Task] = None
+        self._batch: List[Tuple[Optional[Segment], dict]] = []
+        # ids accepted and not committed yet, they reach the idempotency filter once the database confirms them
+        self.pending: Set[str] = set()
+
+    async def put(self, event: dict) -> None:
+        # events waiting for the sync hold their place, so the queue has room for them afterwards
+        if self.queue.maxsize and self.queue.qsize() + self._syncing >= self.queue.maxsize:
+            raise asyncio.QueueFull
+        transaction_id = str(event['transaction_id'])
+        self.pending.add(transaction_id)
+        segment = self._segment
+        if segment is not None:
+            segment.file.write(json.dumps(event, default=str) + '\n')
+            segment.pending += 1
+            self._syncing += 1
+            try:
+                await self._flush(segment)
+            except BaseException:
+                # the line stays in the segment: should it be replayed, the database takes an event
+                # the client never got an answer for, which its retry then finds as a duplicate
+                self.pending.discard(transaction_id)
+                segment.pending -= 1
+                raise
+            finally:
+                self._syncing -= 1
+        self.queue.put_nowait((segment, event))
+
+    async def start(self) -> None:
+        if self.spool_path is not None:
+            self.spool_path.parent.mkdir(parents=True, exist_ok=True)
+            self._segment = self._open_segment()
+            self._replay_task = asyncio.create_task(self._replay())
+        self._task = asyncio.create_task(self._run())
+        logger.info('Webhook write-behind queue started (spool: %s)', self.spool_path)
+
+    async def stop(self) -> None:
+        if self._replay_task is not None:
+            self._replay_task.cancel()
+            with suppress(asyncio.CancelledError):
+                await self._replay_task
+            self._replay_task = None
+        if self._task is not None:
+            self._task.cancel()
+            with suppress(asyncio.CancelledError):
+                await self._task
+            self._task = None
+            # the interrupted batch may or may not have been committed, replaying it is harmless
+            pending, self._batch = self._batch, []
+            while not self.queue.empty():
+                pending.append(self.queue.get_nowait())
+            for start in range(0, len(pending), self.batch_size):
+                items = pending[start : start + self.batch_size]
+                if await self._commit([event for _, event in items], attempts=1):
+                    self._done(items)
+        # committed segments are deleted, the others stay for the next start to replay
+        self._segment = None
+        for segment in list(self._segments):
+            self._release(segment)
+        for segment in self._segments:
+            segment.file.close()
+        self._segments = set()
+        logger.info('Webhook write-behind queue stopped')
+
+    def _open_segment(self) -> Segment:
+        self._sequence += 1
+        path = self.spool_path.with_name(f'{self._prefix}.{self._sequence}')
+        # created under a name the replay doesn't match and locked before it gets its real one,
+        # otherwise a replay could lock, read and unlink it in between, and the events would be
+        # written to an unlinked file
+        temporary = path.with_name(f'.{path.name}')
+        file = open(temporary, 'x')  # noqa: SIM115 - open while the segment is live, closed by _release or stop
+        # held while the segment is live, so the replay of another worker skips it
+        fcntl.flock(file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        os.rename(temporary, path)
+        segment = Segment(path, file)
+        self._segments.add(segment)
+        return segment
+
+    def _release(self, segment: Segment) -> None:
+        if segment.pending or segment is self._segment:
+            return
+        # unlinked while still locked: a replay that opened it meanwhile finds only committed events
+        segment.path.unlink(missing_ok=True)
+        segment.file.close()
+        self._segments.discard(segment)
+
+    def _done(self, items: List[Tuple[Optional[Segment], dict]]) -> None:
+        segments = {segment for segment, _ in items if segment is not None}
+        for segment, _ in items:
+            if segment is not None:
+                segment.pending -= 1
+        for segment in segments:
+            self._release(segment)
+
+    async def _flush(self, segment: Segment) -> None:
+        self._unsynced.add(segment)
+        if self._sync is None:
+            self._sync = asyncio.ensure_future(self._sync_segments())
+        # shielded: a cancelled request must not cancel the sync other events wait for
+        await asyncio.shield(self._sync)
+
+    async def _sync_segments(self) -> None:
+        # one flush for all events written in this loop iteration, the fsync runs off the event loop
+        await asyncio.sleep(0)
+        segments, self._unsynced, self._sync = self._unsynced, set(), None
+        for segment in segments:
+            segment.file.flush()
+        if self.fsync:
+            loop = asyncio.get_running_loop()
+            await asyncio.gather(*(loop.run_in_executor(None, os.fsync, segment.file.fileno()) for segment in segments))
+
+    async def _replay(self) -> None:
+        # segments of every worker, also of workers that no longer exist; live ones are locked
+        for path in sorted(self.spool_path.parent.glob(f'{self.spool_path.name}.*')):
+            try:
+                with open(path) as spool:
+                    await self._replay_segment(path, spool)
+            except FileNotFoundError:
+                # released by its worker since the glob
+                continue
+
+    async def _replay_segment(self, path: Path, spool: TextIO) -> None:
+        try:
+            fcntl.flock(spool, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            return
+        events = []
+        for line in spool:
+            if not line.strip():
+                continue
+            try:
+                events.append(json.loads(line))
+            except ValueError:
+                # a line cut short by a crash, its event was never acknowledged
+                logger.warning('Skipping a partial line in %s', path)
+        if events:
+            logger.info('Replaying %d spooled webhook events from %s', len(events), path)
+        committed = True
+        for start in range(0, len(events), self.batch_size):
+            committed &= await self._commit(events[start : start + self.batch_size], REPLAY_ATTEMPTS)
+        if not committed:
+            logger.error('Could not replay %s, it is retried on the next start', path)
+            return
+        path.unlink(missing_ok=True)
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self.queue.get()]
+            deadline = loop.time() + self.batch_interval
+            while len(batch) < self.batch_size:
+                if not self.queue.empty():
+                    batch.append(self.queue.get_nowait())
+                    continue
+                try:
+                    batch.append(await asyncio.wait_for(self.queue.get(), deadline - loop.time()))
+                except asyncio.TimeoutError:
+                    break
+            self._batch = batch
+            if self._segment is not None and self._segment.pending:
+                # the next events go into a new segment, so this one can be deleted once its events are committed
+                previous, self._segment = self._segment, self._open_segment()
+                self._release(previous)
+            await self._commit([event for _, event in batch])
+            self._batch = []
+            self._done(batch)
+
+    async def _commit(self, batch: List[dict], attempts: Optional[int] = None) -> bool:
+        # attempts=None retries until the database is back
+        delay, attempt = 0.1, 0
+        while True:
+            try:
+                async with postgres.async_session() as session:
+                    created, rejected = await crud_transaction.create_transactions(session, batch)
+                break
+            except Exception:
+                metrics.webhook_group_commits.inc('error')
+                attempt += 1
+                if attempts is not None and attempt >= attempts:
+                    logger.exception('Group commit of %d webhook events failed, leaving them in the spool', len(batch))
+                    return False
+                logger.exception('Group commit of %d webhook events failed, retrying in %.1fs', len(batch), delay)
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, 5)
+        transaction_ids = {str(event['transaction_id']) for event in batch}
+        # created or already stored; a rejected id stays unknown, so the provider can retry it
+        idempotency_filter.add(transaction_ids.difference(rejected))
+        self.pending -= transaction_ids
+        for transaction_id, reason in rejected.items():
+            logger.error('Webhook event %s rejected: %s', transaction_id, reason)
+        logger.info('Group commit: %d events, %d created', len(batch), len(created))
+        metrics.webhook_group_commits.inc('committed')
+        metrics.webhook_events.inc('write_behind', 'created', amount=len(created))
+        metrics.webhook_events.inc('write_behind', 'rejected', amount=len(rejected))
+        metrics.webhook_events.inc('write_behind', 'duplicate', amount=len(batch) - len(created) - len(rejected))
+        return True